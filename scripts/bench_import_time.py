@@ -0,0 +1,79 @@
+"""
+Import-Time Benchmark
+=====================
+
+Measures how long a fresh Python process needs to import each stage
+module (median of several runs, each in its own interpreter so nothing
+is cached). Heavy libraries are imported lazily inside the functions that
+use them, so these numbers should stay in the tens of milliseconds.
+
+Usage:
+    python bench_import_time.py            # all modules, 5 runs each
+    python bench_import_time.py --runs 10 --heavy
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+# (stage folder, module)
+MODULES = [
+    ("stage2_bm25", "search"),
+    ("stage2_bm25", "build_bm25"),
+    ("stage2_bm25", "bm25_storage"),
+    ("stage2_bm25", "date_partitions"),
+    ("stage3_clustering", "evaluation"),
+    ("stage3_clustering", "clustering_algorithms"),
+    ("stage3_clustering", "visualization"),
+    ("stage4_classification", "online_classifier"),
+]
+
+# Reference points: what an eager import used to cost
+HEAVY_MODULES = ["numpy", "scipy.sparse", "pandas", "sklearn.feature_extraction.text", "nltk"]
+
+
+def time_import(module, cwd, runs=5):
+    """Median wall time (ms) of `import module` in a fresh interpreter."""
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; "
+        "print((time.perf_counter() - t) * 1000)"
+    )
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=cwd,
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            return None, out.stderr.strip().splitlines()[-1]
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples), ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--heavy", action="store_true",
+                        help="also time the heavy third-party libraries on their own")
+    args = parser.parse_args()
+
+    rows = [(stage, module) for stage, module in MODULES]
+    if args.heavy:
+        rows += [("(library)", module) for module in HEAVY_MODULES]
+
+    print(f"\n⏱️  Import time, median of {args.runs} fresh interpreters\n")
+    print(f"{'stage':<20} {'module':<35} {'ms':>8}")
+    print("-" * 65)
+    for stage, module in rows:
+        cwd = SCRIPTS_DIR / stage if stage != "(library)" else SCRIPTS_DIR
+        ms, error = time_import(module, cwd, args.runs)
+        value = f"{ms:8.1f}" if ms is not None else f"  failed: {error}"
+        print(f"{stage:<20} {module:<35} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Corpus Manifest (UK + US)
+=========================
+
+Instead of copying every UK / US file into allData/ just to add a
+UK_ / US_ prefix, we describe the corpus with ONE compact table:
+
+    filename      virtual name (UK_debates2023-06-28.txt, US_2023-07-03.txt)
+    country       UK / US
+    date          YYYY-MM-DD parsed from the filename ("" if none)
+    source_path   path of the original file, relative to the manifest folder
+    byte_size     size of the source file in bytes
+    mtime_ns      modification time (used to skip re-hashing unchanged files)
+    content_hash  sha1 of the file content
+
+The source files themselves are the text store: every later stage reads
+a document straight from `source_path`, so the text is never duplicated
+into allData/ or into documents_metadata.csv.
+
+Later stages read documents ONLY through `iter_manifest_documents`, so
+every build sees the same documents (same order, same skip rule). A file
+whose size no longer matches byte_size was edited after the manifest was
+built; it is reported and skipped (re-run stage 1 to pick it up).
+content_hash is not re-checked on read (that would hash the whole corpus
+on every build); it records the content for provenance and lets stage 1
+tell changed files apart.
+"""
+
+import csv
+import os
+import re
+import hashlib
+
+
+MANIFEST_COLUMNS = [
+    "filename", "country", "date", "source_path",
+    "byte_size", "mtime_ns", "content_hash",
+]
+
+DATE_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2})")
+
+
+# -------------------------------------------------------------
+# Small helpers
+# -------------------------------------------------------------
+def parse_document_date(filename):
+    """Returns the YYYY-MM-DD date embedded in a filename, or "" if missing."""
+    match = DATE_PATTERN.search(filename)
+    return match.group(1) if match else ""
+
+
+def file_content_hash(path, chunk_size=1 << 20):
+    """sha1 of a file, read in chunks (never loads the whole file)."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# -------------------------------------------------------------
+# Scan source folders (no copying)
+# -------------------------------------------------------------
+def scan_source_folder(src_folder, prefix, root_dir, previous=None):
+    """
+    Lists the .txt files of one source folder as manifest rows.
+    `previous` is an older manifest (indexed by source_path); files whose
+    size and mtime did not change keep their old hash.
+    """
+    print(f"Scanning folder: {src_folder}")
+
+    rows = []
+    for filename in sorted(os.listdir(src_folder)):
+        src_path = os.path.join(src_folder, filename)
+
+        if not os.path.isfile(src_path) or not filename.endswith(".txt"):
+            continue  # skip subfolders / other files
+
+        # Virtual filename with prefix (do NOT prefix twice)
+        if filename.startswith(prefix + "_"):
+            virtual_name = filename
+        else:
+            virtual_name = f"{prefix}_{filename}"
+
+        st = os.stat(src_path)
+        rel_path = os.path.relpath(src_path, root_dir)
+
+        content_hash = None
+        if previous is not None and rel_path in previous.index:
+            old = previous.loc[rel_path]
+            if int(old["byte_size"]) == st.st_size and int(old["mtime_ns"]) == st.st_mtime_ns:
+                content_hash = old["content_hash"]
+        if content_hash is None:
+            content_hash = file_content_hash(src_path)
+
+        rows.append({
+            "filename": virtual_name,
+            "country": prefix,
+            "date": parse_document_date(filename),
+            "source_path": rel_path,
+            "byte_size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "content_hash": content_hash,
+        })
+
+    return rows
+
+
+def build_manifest(sources, root_dir, previous_manifest_path=None):
+    """
+    sources: list of (folder, prefix) pairs, e.g. [(uk_folder, "UK"), (us_folder, "US")]
+    Rows are sorted by virtual filename, i.e. the same order the old
+    allData/ folder produced (UK_* first, then US_*).
+    """
+    previous = None
+    if previous_manifest_path and os.path.exists(previous_manifest_path):
+        previous = load_manifest(previous_manifest_path).set_index("source_path")
+
+    rows = []
+    for folder, prefix in sources:
+        rows.extend(scan_source_folder(folder, prefix, root_dir, previous))
+
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=MANIFEST_COLUMNS)
+    df = df.sort_values("filename", kind="stable").reset_index(drop=True)
+
+    dupes = df["filename"][df["filename"].duplicated()]
+    if len(dupes):
+        raise ValueError(f"Duplicate virtual filenames in manifest: {sorted(set(dupes))[:5]}")
+
+    df["row_index"] = df.index
+    return df
+
+
+# -------------------------------------------------------------
+# Save / load / read documents
+# -------------------------------------------------------------
+def write_manifest(df, manifest_path):
+    df.to_csv(manifest_path, index=False)
+
+
+def load_manifest(manifest_path):
+    import pandas as pd
+
+    return pd.read_csv(
+        manifest_path,
+        dtype={"date": str, "content_hash": str},
+        keep_default_na=False,
+    )
+
+
+def read_manifest_rows(manifest_path):
+    """Manifest rows as dicts (csv module only, no pandas); row_index is an int."""
+    with open(manifest_path, "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        row["row_index"] = int(row["row_index"])
+    return rows
+
+
+def read_document(row, base_dir, raw=False):
+    """
+    Reads one manifest row straight from its source file.
+    raw=True returns the file bytes (exact byte offsets), else utf-8 text.
+    """
+    path = os.path.join(base_dir, row["source_path"])
+    with open(path, "rb") as f:
+        data = f.read()
+    return data if raw else data.decode("utf-8", errors="ignore")
+
+
+def iter_manifest_documents(manifest_path, rows=None, raw=False):
+    """
+    Yields (row, document) for every readable, non-empty document, one
+    file at a time. rows: optional subset of read_manifest_rows (e.g. one
+    shard), or rows with absolute source paths (then manifest_path may be
+    None). Unreadable files, files whose size differs from the manifest's
+    byte_size (edited after stage 1) and whitespace-only documents are
+    skipped; the first two are reported.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path)) if manifest_path else ""
+    if rows is None:
+        rows = read_manifest_rows(manifest_path)
+
+    for row in rows:
+        try:
+            data = read_document(row, base_dir, raw=True)
+        except OSError as e:
+            print(f"⚠️ Error reading {row['source_path']}: {e}")
+            continue
+
+        expected = row.get("byte_size")
+        if expected not in (None, "") and len(data) != int(expected):
+            print(f"⚠️ Skipping {row['source_path']}: {len(data)} bytes, manifest "
+                  f"says {expected} (changed since the manifest was built)")
+            continue
+
+        text = data.decode("utf-8", errors="ignore")
+        if text.strip():
+            yield row, data if raw else text
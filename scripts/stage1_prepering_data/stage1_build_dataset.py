@@ -1,10 +1,10 @@
 import os
-import shutil
-import pandas as pd
 import numpy as np
 import re
 import html
 
+from corpus_manifest import build_manifest, write_manifest
+
 # -------------------------------------------------------------
 # PATH SETUP
 # -------------------------------------------------------------
@@ -16,9 +16,8 @@ ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
 uk_folder = os.path.join(ROOT_DIR, "UK_british_debates_text_files_normalize")
 us_folder = os.path.join(ROOT_DIR, "allData_cleaned")
 
-# Unified folder (output)
-output_folder = os.path.join(ROOT_DIR, "allData")
-os.makedirs(output_folder, exist_ok=True)
+# Corpus manifest (output) - replaces the old allData/ copy
+manifest_path = os.path.join(ROOT_DIR, "corpus_manifest.csv")
 
 
 # -------------------------------------------------------------
@@ -33,74 +32,25 @@ def clean_congressional_text(raw_text):
 
 
 # -------------------------------------------------------------
-# COPY & RENAME FILES INTO allData/
+# BUILD CORPUS MANIFEST (no copying into allData/)
 # -------------------------------------------------------------
-def copy_and_rename(src_folder, prefix):
-    print(f"Scanning folder: {src_folder}")
-
-    for filename in os.listdir(src_folder):
-        src_path = os.path.join(src_folder, filename)
-
-        if not os.path.isfile(src_path):
-            continue  # skip subfolders
-
-        # New filename with prefix
-        if filename.startswith(prefix + "_"):
-            new_name = filename  # do NOT prefix twice
-        else:
-            new_name = f"{prefix}_{filename}"
-
-        dst_path = os.path.join(output_folder, new_name)
-
-        shutil.copy(src_path, dst_path)
-        print("Copied:", new_name)
-
-
-print("\n=== COPYING FILES TO allData/ ===")
-copy_and_rename(uk_folder, "UK")
-copy_and_rename(us_folder, "US")
-print("✓ Merge complete!\n")
+print("\n=== BUILDING CORPUS MANIFEST ===")
+df = build_manifest(
+    [(uk_folder, "UK"), (us_folder, "US")],
+    root_dir=ROOT_DIR,
+    previous_manifest_path=manifest_path,
+)
+write_manifest(df, manifest_path)
+print(f"✓ Manifest complete! ({len(df)} files, {df.byte_size.sum() / 1e6:.1f} MB referenced, 0 copied)\n")
 
 
 # -------------------------------------------------------------
 # CREATE DATASET (metadata + labels)
 # -------------------------------------------------------------
+# Metadata no longer carries the full text: every row points to its
+# source file through the manifest (source_path / byte_size).
 print("=== BUILDING DATASET (metadata + labels) ===")
 
-rows = []
-
-for filename in sorted(os.listdir(output_folder)):
-    file_path = os.path.join(output_folder, filename)
-
-    if not os.path.isfile(file_path):
-        continue
-
-    # Determine label from filename prefix
-    if filename.startswith("UK_"):
-        country = "UK"
-    elif filename.startswith("US_"):
-        country = "US"
-    else:
-        print("Skipping unknown file:", filename)
-        continue
-
-    # Load raw text
-    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-        raw_text = f.read()
-
-    # NO cleaning is applied now
-    text = raw_text
-
-    rows.append({
-        "text": text,
-        "country": country,
-        "filename": filename,
-    })
-
-# Build DataFrame
-df = pd.DataFrame(rows)
-df["row_index"] = df.index
-
 print("\nDataset created:")
 print(df.head())
 print(df.country.value_counts())
@@ -113,7 +63,7 @@ print(f"Total documents: {len(df)}")
 print("\n=== SAVING OUTPUT FILES ===")
 
 metadata_path = os.path.join(ROOT_DIR, "documents_metadata.csv")
-df.to_csv(metadata_path, index=False)
+df[["row_index", "filename", "country", "date", "source_path"]].to_csv(metadata_path, index=False)
 
 label_map = {"UK": 0, "US": 1}
 y_num = df["country"].map(label_map).to_numpy()
@@ -123,6 +73,7 @@ np.save(os.path.join(ROOT_DIR, "y_labels_num.npy"), y_num)
 np.save(os.path.join(ROOT_DIR, "y_labels_str.npy"), y_str)
 
 print("Saved:")
+print(" - corpus_manifest.csv")
 print(" - documents_metadata.csv")
 print(" - y_labels_num.npy")
 print(" - y_labels_str.npy")
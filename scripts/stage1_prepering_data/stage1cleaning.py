@@ -173,9 +173,10 @@ def clean_file(input_file_path, output_file_path):
     print(f"   נחסכו: {len(content) - len(cleaned):,} תווים ({100 * (1 - len(cleaned)/len(content)):.1f}%)")
     print("-" * 40)
 
-def process_directory(input_dir, output_dir, prefix):
+def process_directory(input_dir, output_dir, prefix, output_prefix=""):
     """
     מבצע ניקוי על כל הקבצים בתיקייה שמתחילים בקידומת נתונה.
+    output_prefix מתווסף לשם קובץ הפלט (למשל 'US_'), כך שאין צורך בהעתקה ל-allData.
     """
     print(f"מתחיל עיבוד בתיקייה: {input_dir}")
     
@@ -197,6 +198,8 @@ def process_directory(input_dir, output_dir, prefix):
     # 3. עיבוד כל קובץ
     for input_file_path in file_paths:
         file_name = os.path.basename(input_file_path)
+        if not file_name.startswith(output_prefix):
+            file_name = output_prefix + file_name
         output_file_path = os.path.join(output_dir, file_name)
         
         clean_file(input_file_path, output_file_path)
@@ -208,9 +211,11 @@ def process_directory(input_dir, output_dir, prefix):
 if __name__ == "__main__":
     
     # הגדרות עיבוד
-    INPUT_DIRECTORY = 'allData'
+    # קוראים ישירות מתיקיית המקור של ארה"ב (אין יותר העתקה ל-allData)
+    INPUT_DIRECTORY = 'US_congressional_speeches_Text_Files'
     OUTPUT_DIRECTORY = 'allData_cleaned'
-    FILE_PREFIX = 'US_'
+    FILE_PREFIX = ''
+    OUTPUT_PREFIX = 'US_'
     
     # הפעלת עיבוד התיקייה
-    process_directory(INPUT_DIRECTORY, OUTPUT_DIRECTORY, FILE_PREFIX)
\ No newline at end of file
+    process_directory(INPUT_DIRECTORY, OUTPUT_DIRECTORY, FILE_PREFIX, OUTPUT_PREFIX)
\ No newline at end of file
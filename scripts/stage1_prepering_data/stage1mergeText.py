@@ -1,10 +1,11 @@
 import os
-import shutil
 
 import re
 
 import html
 
+from corpus_manifest import build_manifest, write_manifest
+
 
 # תיקיית הסקריפט (scripts/)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -16,11 +17,8 @@ ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
 uk_folder = os.path.join(ROOT_DIR, "UK_british_debates_text_files_normalize")
 us_folder = os.path.join(ROOT_DIR, "US_congressional_speeches_Text_Files")
 
-# תיקיית output (allData) גם ברמת ROOT
-output_folder = os.path.join(ROOT_DIR, "allData")
-
-# יצירת התיקייה המאוחדת
-os.makedirs(output_folder, exist_ok=True)
+# במקום להעתיק הכל ל-allData - כותבים מניפסט אחד ברמת ROOT
+manifest_path = os.path.join(ROOT_DIR, "corpus_manifest_raw.csv")
 
 def clean_congressional_text(raw_text):
 
@@ -82,23 +80,11 @@ def clean_congressional_text(raw_text):
 
     return text
 
-def copy_and_rename(src_folder, prefix):
-    print(f"Scanning: {src_folder}")
-    for filename in os.listdir(src_folder):
-        src_path = os.path.join(src_folder, filename)
-
-        if not os.path.isfile(src_path):
-            continue
-
-        new_name = f"{prefix}_{filename}"
-        dst_path = os.path.join(output_folder, new_name)
-
-        shutil.copy(src_path, dst_path)
-        print("Copied:", new_name)
-
-copy_and_rename(uk_folder, "UK")
-copy_and_rename(us_folder, "US")
-
-print("✓ המיזוג הסתיים! כל הקבצים נמצאים בתיקיית allData.")
-
+df = build_manifest(
+    [(uk_folder, "UK"), (us_folder, "US")],
+    root_dir=ROOT_DIR,
+    previous_manifest_path=manifest_path,
+)
+write_manifest(df, manifest_path)
 
+print(f"✓ המיזוג הסתיים! {len(df)} קבצים רשומים במניפסט {os.path.basename(manifest_path)} (ללא העתקה).")
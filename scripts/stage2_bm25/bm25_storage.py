@@ -0,0 +1,299 @@
+"""
+BM25 Matrix Storage (float32 / quantized impacts)
+=================================================
+
+The BM25 matrix comes out of TfidfVectorizer + BM25Transformer as float64.
+This module stores it with a configurable precision:
+
+    float64 / float32          plain floats
+    uint8 / uint16 + global    q = round(w / scale), ONE scale for all terms
+    uint8 / uint16 + per_term  q = round(w / scale[term]), one scale per column
+
+Quantized matrices are saved as a normal .npz (integer data) plus a
+"<name>_scales.npy" file next to it. `load_bm25_matrix` dequantizes
+transparently, so stage 3 never needs to know how the matrix was stored.
+
+The same stored arrays can also be written uncompressed as a row store
+("<name>_data / _indices / _indptr / _shape.npy"). `read_row_block`
+then reads any range of rows through memory maps, without loading the
+whole matrix (streaming training in stage 4).
+"""
+
+from pathlib import Path
+import numpy as np
+from scipy.sparse import csr_matrix, save_npz, load_npz
+
+
+FLOAT_PRECISIONS = ("float64", "float32")
+INT_PRECISIONS = {"uint8": np.uint8, "uint16": np.uint16}
+SCALE_MODES = ("global", "per_term")
+
+
+def scales_path_for(matrix_path):
+    matrix_path = Path(matrix_path)
+    return matrix_path.with_name(matrix_path.stem + "_scales.npy")
+
+
+# ----------------------------------------------------
+# Quantize / dequantize
+# ----------------------------------------------------
+def quantize_bm25(X, precision="uint8", scale_mode="global"):
+    """
+    Linear impact quantization of a (non-negative) BM25 matrix.
+    Returns (X_quantized, scales); scales is a 0-d array for "global"
+    or one value per term for "per_term".
+    Every stored weight is kept at >= 1 so the sparsity pattern is unchanged.
+    """
+    if precision not in INT_PRECISIONS:
+        raise ValueError(f"Unknown integer precision: {precision}")
+    if scale_mode not in SCALE_MODES:
+        raise ValueError(f"Unknown scale mode: {scale_mode}")
+
+    dtype = INT_PRECISIONS[precision]
+    levels = np.iinfo(dtype).max
+
+    X = csr_matrix(X)
+    data = X.data.astype(np.float64)
+
+    if scale_mode == "global":
+        max_w = data.max() if data.size else 1.0
+        scales = np.array(max_w / levels if max_w > 0 else 1.0, dtype=np.float32)
+        q = data / scales
+    else:
+        col_max = np.zeros(X.shape[1], dtype=np.float64)
+        np.maximum.at(col_max, X.indices, data)
+        col_max[col_max == 0] = levels  # unused terms -> scale 1
+        scales = (col_max / levels).astype(np.float32)
+        q = data / scales[X.indices]
+
+    q = np.clip(np.rint(q), 1, levels).astype(dtype)
+    Xq = csr_matrix((q, X.indices.copy(), X.indptr.copy()), shape=X.shape)
+    return Xq, scales
+
+
+def dequantize_bm25(Xq, scales, dtype=np.float32):
+    """Inverse of quantize_bm25 (float32 by default)."""
+    scales = np.asarray(scales, dtype=dtype)
+    if scales.ndim == 0:
+        data = Xq.data.astype(dtype) * scales
+    else:
+        data = Xq.data.astype(dtype) * scales[Xq.indices]
+    return csr_matrix((data, Xq.indices, Xq.indptr), shape=Xq.shape)
+
+
+def convert_bm25(X, precision="float32", scale_mode="global"):
+    """Returns (stored_matrix, scales_or_None) for the requested precision."""
+    if precision in FLOAT_PRECISIONS:
+        return csr_matrix(X).astype(precision), None
+    return quantize_bm25(X, precision, scale_mode)
+
+
+# ----------------------------------------------------
+# Save / load
+# ----------------------------------------------------
+def save_bm25_matrix(path, X, precision="float32", scale_mode="global", row_store=False):
+    """
+    Saves X with the requested precision (scales written next to it).
+    row_store=True also writes the memory-mappable row store.
+    """
+    X_stored, scales = convert_bm25(X, precision, scale_mode)
+    save_npz(path, X_stored)
+    if row_store:
+        save_row_store(path, X_stored)
+    else:
+        for stale in row_store_paths(path).values():
+            if stale.exists():
+                stale.unlink()  # row store of an older build
+
+    sp = scales_path_for(path)
+    if scales is not None:
+        np.save(sp, scales)
+    elif sp.exists():
+        sp.unlink()  # stale scales from an older quantized build
+    return X_stored, scales
+
+
+def load_bm25_matrix(path, dtype=np.float32):
+    """
+    Loads a BM25 matrix saved by save_bm25_matrix (or plain save_npz).
+    Quantized matrices are dequantized; float matrices are cast to dtype.
+    """
+    X = load_npz(path).tocsr()
+    if X.dtype.kind == "u":
+        sp = scales_path_for(path)
+        if not sp.exists():
+            raise FileNotFoundError(f"Quantized matrix without scales file: {sp}")
+        return dequantize_bm25(X, np.load(sp), dtype=dtype)
+    return X.astype(dtype, copy=False)
+
+
+# ----------------------------------------------------
+# Row store: memory-mapped row blocks
+# ----------------------------------------------------
+ROW_STORE_PARTS = ("data", "indices", "indptr", "shape")
+
+
+def row_store_paths(matrix_path):
+    matrix_path = Path(matrix_path)
+    return {part: matrix_path.with_name(f"{matrix_path.stem}_{part}.npy")
+            for part in ROW_STORE_PARTS}
+
+
+def save_row_store(matrix_path, X_stored):
+    """Uncompressed CSR arrays of the stored matrix (scales stay in _scales.npy)."""
+    X_stored = csr_matrix(X_stored)
+    paths = row_store_paths(matrix_path)
+    np.save(paths["data"], X_stored.data)
+    np.save(paths["indices"], X_stored.indices)
+    np.save(paths["indptr"], X_stored.indptr.astype(np.int64))
+    np.save(paths["shape"], np.array(X_stored.shape, dtype=np.int64))
+
+
+def open_row_store(matrix_path):
+    """
+    Memory-maps the row store of a saved matrix. Only indptr (one value
+    per document) is read into memory. Raises FileNotFoundError if the
+    matrix was saved without row_store=True.
+    """
+    paths = row_store_paths(matrix_path)
+    store = {
+        "data": np.load(paths["data"], mmap_mode="r"),
+        "indices": np.load(paths["indices"], mmap_mode="r"),
+        "indptr": np.load(paths["indptr"]),
+        "shape": tuple(np.load(paths["shape"])),
+        "scales": None,
+    }
+    sp = scales_path_for(matrix_path)
+    if store["data"].dtype.kind == "u":
+        if not sp.exists():
+            raise FileNotFoundError(f"Quantized matrix without scales file: {sp}")
+        store["scales"] = np.load(sp)
+    return store
+
+
+def read_row_block(store, start, stop, dtype=np.float32):
+    """Rows [start, stop) as a CSR matrix; only their entries are read from disk."""
+    indptr = store["indptr"]
+    lo, hi = indptr[start], indptr[stop]
+    block = csr_matrix(
+        (np.array(store["data"][lo:hi]), np.array(store["indices"][lo:hi]),
+         indptr[start:stop + 1] - lo),
+        shape=(stop - start, store["shape"][1]),
+    )
+    if store["scales"] is not None:
+        return dequantize_bm25(block, store["scales"], dtype=dtype)
+    return block.astype(dtype, copy=False)
+
+
+# ----------------------------------------------------
+# Term-frequency cache (for k1 / b sweeps and new documents)
+# ----------------------------------------------------
+TF_CACHE_FILES = {
+    "tf": "bm25_tf_cache.npz",            # matrix BM25 is applied to (l2 TF-IDF)
+    "doc_lengths": "bm25_doc_lengths.npy",
+    "idf": "bm25_idf.npy",
+}
+
+
+def save_bm25_stats(folder, doc_lengths, idf_vector):
+    """Saves doc lengths + idf (small; needed to weight new documents)."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    np.save(folder / TF_CACHE_FILES["doc_lengths"], np.asarray(doc_lengths, dtype=np.float64))
+    np.save(folder / TF_CACHE_FILES["idf"], np.asarray(idf_vector, dtype=np.float64))
+
+
+def save_tf_cache(folder, tf_matrix, doc_lengths, idf_vector):
+    """Saves everything BM25 needs, so weights can be recomputed without re-tokenizing."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    save_npz(folder / TF_CACHE_FILES["tf"], csr_matrix(tf_matrix))
+    save_bm25_stats(folder, doc_lengths, idf_vector)
+
+
+def load_tf_cache(folder):
+    """Returns (tf_matrix, doc_lengths, idf_vector) saved by save_tf_cache."""
+    folder = Path(folder)
+    tf_matrix = load_npz(folder / TF_CACHE_FILES["tf"]).tocsr()
+    doc_lengths = np.load(folder / TF_CACHE_FILES["doc_lengths"])
+    idf_vector = np.load(folder / TF_CACHE_FILES["idf"])
+    return tf_matrix, doc_lengths, idf_vector
+
+
+def matrix_nbytes(X, scales=None):
+    """Stored size of a CSR matrix, plus its _scales.npy array when quantized."""
+    nbytes = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    if scales is not None:
+        nbytes += np.asarray(scales).nbytes
+    return nbytes
+
+
+# ----------------------------------------------------
+# Agreement report vs float64
+# ----------------------------------------------------
+def sample_queries(X, n_queries=200, max_terms=3, seed=42):
+    """
+    Random 1..max_terms term queries. Terms are drawn in proportion to
+    their document frequency, so queries look like real (non-empty) ones.
+    """
+    rng = np.random.default_rng(seed)
+    df = np.bincount(X.indices, minlength=X.shape[1]).astype(np.float64)
+    p = df / df.sum()
+    return [
+        rng.choice(X.shape[1], size=rng.integers(1, max_terms + 1), replace=False, p=p)
+        for _ in range(n_queries)
+    ]
+
+
+def storage_agreement_report(X64, configs, n_queries=200, k=10,
+                             n_clusters=2, seed=42):
+    """
+    Compares each (precision, scale_mode) config with the float64 matrix:
+    - memory size of the stored matrix
+    - ranking agreement: mean overlap@k and top-1 match over sampled queries
+    - clustering agreement: ARI between KMeans labels (same seed)
+    Returns a list of dict rows (one per config).
+    """
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import adjusted_rand_score
+    from search import score_query, top_k
+
+    X64 = csr_matrix(X64).astype(np.float64)
+    queries = sample_queries(X64, n_queries=n_queries, seed=seed)
+    ref_tops = [top_k(score_query(X64, q), k) for q in queries]
+    ref_labels = KMeans(n_clusters=n_clusters, random_state=seed, n_init=10).fit_predict(X64)
+
+    rows = []
+    for precision, scale_mode in configs:
+        X_stored, scales = convert_bm25(X64, precision, scale_mode)
+        X_used = X_stored if scales is None else dequantize_bm25(X_stored, scales)
+
+        overlaps, top1 = [], []
+        for q, ref in zip(queries, ref_tops):
+            got = top_k(score_query(X_used, q), k)
+            overlaps.append(len(set(got) & set(ref)) / max(len(ref), 1))
+            top1.append(len(got) > 0 and len(ref) > 0 and got[0] == ref[0])
+
+        labels = KMeans(n_clusters=n_clusters, random_state=seed, n_init=10).fit_predict(X_used)
+
+        rows.append({
+            "precision": precision,
+            "scale_mode": scale_mode if scales is not None else "",
+            "bytes": matrix_nbytes(X_stored, scales),
+            "bytes_vs_float64": matrix_nbytes(X_stored, scales) / matrix_nbytes(X64),
+            f"overlap@{k}": float(np.mean(overlaps)),
+            "top1_match": float(np.mean(top1)),
+            "max_abs_error": float(abs(X_used - X64).max()) if X64.nnz else 0.0,
+            "kmeans_ari": adjusted_rand_score(ref_labels, labels),
+        })
+    return rows
+
+
+DEFAULT_REPORT_CONFIGS = [
+    ("float64", "global"),
+    ("float32", "global"),
+    ("uint16", "global"),
+    ("uint16", "per_term"),
+    ("uint8", "global"),
+    ("uint8", "per_term"),
+]
@@ -0,0 +1,160 @@
+"""
+BM25 k1 / b Parameter Sweep
+===========================
+
+Uses the term-frequency cache written by build_bm25.py (BM25_SAVE_TF_CACHE)
+or sharded_build.py --tf-cache
+(bm25_tf_cache.npz, bm25_doc_lengths.npy, bm25_idf.npy), so no file is
+re-read and nothing is re-tokenized. Every (k1, b) setting is one O(nnz)
+pass over the cached CSR data.
+
+Optional scoring per setting:
+    clustering  KMeans(2) + stage-3 evaluate_clustering (precision, recall, f1, accuracy)
+    retrieval   known-item search: queries sampled from a document's own terms,
+                scored by MRR / success@k of finding that document
+
+Usage:
+    python bm25_sweep.py --cache uk_us_outputs --score retrieval
+    python bm25_sweep.py --k1 0.9 1.2 1.5 --b 0.5 0.75 --score clustering
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from bm25_storage import TF_CACHE_FILES, load_tf_cache
+from build_bm25 import BM25Transformer
+from search import score_query
+
+# stage-3 evaluation (used by --score clustering)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "stage3_clustering"))
+
+
+DEFAULT_K1 = [0.6, 0.8, 1.0, 1.2, 1.4, 1.6, 1.8, 2.0, 2.2, 2.4]
+DEFAULT_B = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.75, 0.9, 1.0]
+
+
+# ----------------------------------------------------
+# Scoring helpers
+# ----------------------------------------------------
+def known_item_queries(tf_matrix, n_queries=200, terms_per_query=3, seed=42):
+    """
+    (doc_id, term_ids) pairs: terms are drawn from the document's own
+    entries in proportion to their cached tf, independent of k1 / b.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = np.diff(tf_matrix.indptr)
+    candidates = np.flatnonzero(lengths >= terms_per_query)
+    docs = rng.choice(candidates, size=min(n_queries, len(candidates)), replace=False)
+
+    queries = []
+    for d in docs:
+        start, end = tf_matrix.indptr[d], tf_matrix.indptr[d + 1]
+        p = tf_matrix.data[start:end] / tf_matrix.data[start:end].sum()
+        terms = rng.choice(tf_matrix.indices[start:end], size=terms_per_query,
+                           replace=False, p=p)
+        queries.append((d, terms))
+    return queries
+
+
+def score_retrieval(X, queries, k=10):
+    X = X.tocsc()  # column slicing per query term is much faster on CSC
+    reciprocal_ranks, hits = [], []
+    for doc_id, terms in queries:
+        scores = score_query(X, terms)
+        rank = 1 + int((scores > scores[doc_id]).sum())
+        reciprocal_ranks.append(1.0 / rank)
+        hits.append(rank <= k)
+    return {"mrr": float(np.mean(reciprocal_ranks)), f"success@{k}": float(np.mean(hits))}
+
+
+def score_clustering(X, y):
+    from sklearn.cluster import KMeans
+    from evaluation import evaluate_clustering
+
+    labels = KMeans(n_clusters=2, random_state=42, n_init=10).fit_predict(X)
+    p, r, f, a = evaluate_clustering(y, labels)
+    return {"precision": p, "recall": r, "f1": f, "accuracy": a}
+
+
+# ----------------------------------------------------
+# Sweep
+# ----------------------------------------------------
+def sweep_bm25(tf_matrix, doc_lengths, idf_vector, k1_values, b_values,
+               score=None, y=None, queries=None):
+    """
+    Recomputes the BM25 weights for every (k1, b) on the cached tf matrix.
+    Returns a DataFrame with one row per setting (+ metrics if score is set).
+    """
+    tf_matrix = csr_matrix(tf_matrix)
+    avg_doc_length = doc_lengths.mean()
+    data = np.empty(tf_matrix.nnz, dtype=np.float64)
+    X = csr_matrix((data, tf_matrix.indices, tf_matrix.indptr), shape=tf_matrix.shape)
+
+    if score == "retrieval" and queries is None:
+        queries = known_item_queries(tf_matrix)
+
+    rows = []
+    for k1 in k1_values:
+        for b in b_values:
+            t0 = time.perf_counter()
+            BM25Transformer(k1=k1, b=b).weights(
+                tf_matrix, doc_lengths, avg_doc_length, idf_vector, out=data
+            )
+            row = {"k1": k1, "b": b, "weight_seconds": time.perf_counter() - t0}
+
+            if score == "retrieval":
+                row.update(score_retrieval(X, queries))
+            elif score == "clustering":
+                row.update(score_clustering(X, y))
+            rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fast BM25 k1 / b sweep from the tf cache")
+    parser.add_argument("--cache", default="uk_us_outputs",
+                        help="folder with bm25_tf_cache.npz / bm25_doc_lengths.npy / bm25_idf.npy")
+    parser.add_argument("--k1", type=float, nargs="+", default=DEFAULT_K1)
+    parser.add_argument("--b", type=float, nargs="+", default=DEFAULT_B)
+    parser.add_argument("--score", choices=["none", "retrieval", "clustering"], default="none")
+    parser.add_argument("--out", default=None, help="CSV path [<cache>/bm25_sweep.csv]")
+    args = parser.parse_args()
+
+    cache = Path(args.cache)
+    print(f"\n📦 Loading tf cache from: {cache}")
+    if not (cache / TF_CACHE_FILES["tf"]).exists():
+        parser.error(f"{cache / TF_CACHE_FILES['tf']} not found; rebuild with "
+                     "BM25_SAVE_TF_CACHE = True or sharded_build.py --tf-cache")
+    tf_matrix, doc_lengths, idf_vector = load_tf_cache(cache)
+    print(f"   • tf matrix: shape={tf_matrix.shape}, nnz={tf_matrix.nnz}")
+
+    y = np.load(cache / "y_labels_num.npy", allow_pickle=True) \
+        if args.score == "clustering" else None
+
+    n = len(args.k1) * len(args.b)
+    print(f"\n🔄 Sweeping {n} (k1, b) settings, score={args.score}...")
+    t0 = time.perf_counter()
+    results = sweep_bm25(tf_matrix, doc_lengths, idf_vector, args.k1, args.b,
+                         score=None if args.score == "none" else args.score, y=y)
+    print(f"✅ Done in {time.perf_counter() - t0:.2f}s "
+          f"(weights only: {results['weight_seconds'].sum():.2f}s)")
+
+    out = Path(args.out) if args.out else cache / "bm25_sweep.csv"
+    results.to_csv(out, index=False)
+
+    metric = {"retrieval": "mrr", "clustering": "accuracy"}.get(args.score)
+    if metric:
+        best = results.loc[results[metric].idxmax()]
+        print(f"🏆 Best {metric}={best[metric]:.4f} at k1={best['k1']}, b={best['b']}")
+    print(f"💾 Saved: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,19 +13,25 @@ This script:
 """
 
 import os
+import sys
 import numpy as np
-import pandas as pd
 from pathlib import Path
-from tqdm import tqdm
 import warnings
 warnings.filterwarnings("ignore")
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from scipy.sparse import save_npz
+# stage-1 corpus manifest (shared document reader)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "stage1_prepering_data"))
+from corpus_manifest import read_manifest_rows, iter_manifest_documents
 
-# NLTK stopwords
-import nltk
-from nltk.corpus import stopwords
+# Heavy libraries (pandas, sklearn, scipy, tqdm, nltk) are imported inside
+# the functions that need them, so importing this module (e.g. for
+# BM25Transformer or TOKEN_PATTERN) stays fast.
+
+
+TOKEN_PATTERN = r"(?u)\b\w+\b"
+
+# Versioned stopword snapshot shipped with the repo (no network access)
+STOPWORDS_SNAPSHOT = Path(__file__).resolve().parent / "stopwords_english_v1.txt"
 
 
 # ----------------------------------------------------
@@ -42,28 +48,43 @@ class BM25Transformer:
 
     def fit_transform(self, tf_matrix, doc_lengths, avg_doc_length, idf_vector):
         bm25_matrix = tf_matrix.copy()
-
-        for i in range(bm25_matrix.shape[0]):
-            doc_len = doc_lengths[i]
-            length_norm = 1 - self.b + self.b * (doc_len / avg_doc_length)
-
-            row = bm25_matrix.getrow(i)
-            row_data = row.data
-
-            row_data = row_data * (self.k1 + 1) / (row_data + self.k1 * length_norm)
-
-            col_indices = row.indices
-            row_data = row_data * idf_vector[col_indices]
-
-            bm25_matrix.data[bm25_matrix.indptr[i]:bm25_matrix.indptr[i+1]] = row_data
-
+        bm25_matrix.data = self.weights(
+            tf_matrix, doc_lengths, avg_doc_length, idf_vector
+        )
         return bm25_matrix
 
+    def weights(self, tf_matrix, doc_lengths, avg_doc_length, idf_vector, out=None):
+        """
+        BM25 weights for every stored entry of a CSR tf matrix, in O(nnz).
+        Returns a new data array (or fills `out`), aligned with tf_matrix.data.
+        """
+        row_lengths = np.repeat(
+            np.asarray(doc_lengths, dtype=np.float64) / avg_doc_length,
+            np.diff(tf_matrix.indptr),
+        )
+        length_norm = 1 - self.b + self.b * row_lengths
+
+        tf = tf_matrix.data
+        out = np.empty(tf.shape, dtype=np.float64) if out is None else out
+        np.multiply(tf, self.k1 + 1, out=out)
+        out /= tf + self.k1 * length_norm
+        out *= idf_vector[tf_matrix.indices]
+        return out
+
 
 # ----------------------------------------------------
 # NLTK stopwords helpers
 # ----------------------------------------------------
+def load_stopwords_snapshot(path=STOPWORDS_SNAPSHOT):
+    """Reads the bundled stopword list (lines starting with # are comments)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip() and not line.startswith("#")}
+
+
 def download_nltk_data():
+    import nltk
+    from nltk.corpus import stopwords
+
     print("\n📥 Checking NLTK stopwords...")
     try:
         _ = stopwords.words("english")
@@ -74,8 +95,20 @@ def download_nltk_data():
         print("✅ Download completed!")
 
 
-def get_nltk_stopwords():
+def get_nltk_stopwords(use_snapshot=True):
+    """
+    NLTK english stopwords. By default they come from the bundled snapshot
+    (stopwords_english_v1.txt), so nothing touches nltk or the network;
+    use_snapshot=False reads (and if needed downloads) the live NLTK corpus.
+    """
     print("\n🛑 Loading NLTK stopwords...")
+    if use_snapshot and STOPWORDS_SNAPSHOT.exists():
+        sw = load_stopwords_snapshot()
+        print(f"   • Loaded {len(sw)} stopwords (snapshot: {STOPWORDS_SNAPSHOT.name})")
+        return sw
+
+    from nltk.corpus import stopwords
+
     download_nltk_data()
     sw = set(stopwords.words("english"))
     print(f"   • Loaded {len(sw)} stopwords (pure NLTK)")
@@ -90,6 +123,8 @@ def load_country_documents(uk_folder, us_folder):
     Reads all .txt files from UK and US folders.
     Returns a DataFrame with: text, country, filename
     """
+    import pandas as pd
+    from tqdm import tqdm
 
     def load_from_folder(folder_path, country_label):
         folder = Path(folder_path)
@@ -128,15 +163,89 @@ def load_country_documents(uk_folder, us_folder):
     return df
 
 
+# ----------------------------------------------------
+# Load documents through the stage-1 corpus manifest
+# ----------------------------------------------------
+def load_manifest_documents(manifest_path):
+    """
+    Reads documents listed in corpus_manifest.csv (stage 1) straight from
+    their source files - nothing was copied into allData/.
+    Returns a DataFrame with: text, country, filename, date, source_path
+    """
+    import pandas as pd
+    from tqdm import tqdm
+
+    rows = read_manifest_rows(manifest_path)
+    print(f"\n📂 Loading {len(rows)} documents listed in: {manifest_path}")
+
+    records = [
+        {"text": text, "country": row["country"], "filename": row["filename"],
+         "date": row["date"], "source_path": row["source_path"]}
+        for row, text in tqdm(iter_manifest_documents(manifest_path, rows),
+                              total=len(rows), desc="Loading manifest files")
+    ]
+    df = pd.DataFrame(records, columns=["text", "country", "filename", "date", "source_path"])
+
+    print(f"\n✅ Total documents loaded: {len(df)}")
+    print(df["country"].value_counts())
+    return df
+
+
+# ----------------------------------------------------
+# TF-IDF -> BM25 (shared by the single-process and sharded builds)
+# ----------------------------------------------------
+def tfidf_to_bm25(tfidf_matrix, idf_vector, k1=1.5, b=0.75,
+                  output_folder=None, tf_cache=False):
+    """
+    Applies BM25 on top of the (l2-normalized) TF-IDF matrix.
+    Document length = row sum of the TF-IDF matrix.
+    If output_folder is given, doc lengths + idf are saved there (classifying
+    new documents); tf_cache=True also saves the TF-IDF matrix (bm25_sweep.py).
+    """
+    print("\n🔄 Applying BM25 transformation...")
+    doc_lengths = np.array(tfidf_matrix.sum(axis=1)).flatten()
+    avg_doc_length = doc_lengths.mean()
+
+    if output_folder is not None:
+        from bm25_storage import save_bm25_stats, save_tf_cache
+        if tf_cache:
+            save_tf_cache(output_folder, tfidf_matrix, doc_lengths, idf_vector)
+        else:
+            save_bm25_stats(output_folder, doc_lengths, idf_vector)
+
+    return BM25Transformer(k1=k1, b=b).fit_transform(
+        tfidf_matrix, doc_lengths, avg_doc_length, idf_vector
+    )
+
+
+def bm25_stats(bm25_matrix, matrix_name):
+    stats = {
+        "matrix_name": matrix_name,
+        "num_documents": bm25_matrix.shape[0],
+        "num_features": bm25_matrix.shape[1],
+        "sparsity": (1 - bm25_matrix.nnz / (bm25_matrix.shape[0] * bm25_matrix.shape[1])) * 100,
+        "non_zero_elements": bm25_matrix.nnz,
+    }
+
+    print("✅ BM25 matrix ready")
+    print(f"   • Documents: {stats['num_documents']}")
+    print(f"   • Features: {stats['num_features']}")
+    print(f"   • Sparsity: {stats['sparsity']:.2f}%")
+    return stats
+
+
 # ----------------------------------------------------
 # Build TF-IDF + BM25 on ALL documents together
 # ----------------------------------------------------
 def build_bm25_matrix(documents, stopwords_set,
                       min_df=5, max_df=0.95, max_features=20000,
-                      matrix_name="BM25-UK-US"):
+                      matrix_name="BM25-UK-US", output_folder=None, tf_cache=False):
     """
     One shared vectorizer for UK+US.
+    output_folder / tf_cache: see tfidf_to_bm25.
     """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from tqdm import tqdm
 
     print(f"\n{'='*70}")
     print(f"🔨 Building {matrix_name}")
@@ -148,7 +257,7 @@ def build_bm25_matrix(documents, stopwords_set,
         max_features=max_features,
         stop_words=list(stopwords_set),
         lowercase=True,
-        token_pattern=r"(?u)\b\w+\b",
+        token_pattern=TOKEN_PATTERN,
         ngram_range=(1, 1),
         norm="l2",
         use_idf=True,
@@ -160,36 +269,70 @@ def build_bm25_matrix(documents, stopwords_set,
     feature_names = vectorizer.get_feature_names_out()
     print(f"\n✅ TF-IDF created: shape={tfidf_matrix.shape}")
 
-    # BM25
-    print("\n🔄 Applying BM25 transformation...")
-    doc_lengths = np.array(tfidf_matrix.sum(axis=1)).flatten()
-    avg_doc_length = doc_lengths.mean()
-    idf_vector = vectorizer.idf_
+    bm25_matrix = tfidf_to_bm25(tfidf_matrix, vectorizer.idf_,
+                                output_folder=output_folder, tf_cache=tf_cache)
+    stats = bm25_stats(bm25_matrix, matrix_name)
 
-    bm25_matrix = BM25Transformer().fit_transform(
-        tfidf_matrix, doc_lengths, avg_doc_length, idf_vector
-    )
+    return bm25_matrix, feature_names, vectorizer, stats
 
-    stats = {
-        "matrix_name": matrix_name,
-        "num_documents": bm25_matrix.shape[0],
-        "num_features": bm25_matrix.shape[1],
-        "sparsity": (1 - bm25_matrix.nnz / (bm25_matrix.shape[0] * bm25_matrix.shape[1])) * 100,
-        "non_zero_elements": bm25_matrix.nnz,
-    }
 
-    print("✅ BM25 matrix ready")
-    print(f"   • Documents: {stats['num_documents']}")
-    print(f"   • Features: {stats['num_features']}")
-    print(f"   • Sparsity: {stats['sparsity']:.2f}%")
+# ----------------------------------------------------
+# Save outputs
+# ----------------------------------------------------
+def save_bm25_outputs(output_folder, X_bm25, feature_names, df, stats,
+                      storage="float32", scale_mode="global", row_store=False):
+    """
+    Writes the stage-2 outputs into output_folder.
+    df must hold one row per matrix row with at least a "country" column.
+    row_store=True also writes the memory-mappable row store (stage 4 writes
+    it on first use otherwise).
+    """
+    import pandas as pd
+    from bm25_storage import save_bm25_matrix
 
-    return bm25_matrix, feature_names, vectorizer, stats
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+
+    # === Create labels vector y ===
+    # Option 1: keep as strings "UK"/"US"
+    y_str = df["country"].values
+
+    # Option 2: numeric labels 0=UK, 1=US (useful for sklearn)
+    label_map = {"UK": 0, "US": 1}
+    y_num = df["country"].map(label_map).values
+
+    print("\n💾 Saving outputs...")
+
+    # BM25 matrix (+ X_bm25_uk_us_scales.npy when quantized)
+    save_bm25_matrix(output_folder / "X_bm25_uk_us.npz", X_bm25,
+                     precision=storage, scale_mode=scale_mode, row_store=row_store)
+    stats["storage"] = storage if storage.startswith("float") \
+        else f"{storage}-{scale_mode}"
+
+    # labels
+    np.save(output_folder / "y_labels_str.npy", y_str)
+    np.save(output_folder / "y_labels_num.npy", y_num)
+
+    # feature names (vocabulary)
+    with open(output_folder / "bm25_feature_names.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(feature_names))
+
+    # DataFrame mapping (metadata only - the text stays in the source files)
+    df.drop(columns=["text"], errors="ignore").to_csv(
+        output_folder / "documents_metadata.csv", index=False)
+
+    # Stats
+    pd.DataFrame([stats]).to_csv(output_folder / "bm25_stats.csv", index=False)
 
 
 # ----------------------------------------------------
 # MAIN
 # ----------------------------------------------------
 def main():
+    import pandas as pd
+    from bm25_storage import storage_agreement_report, DEFAULT_REPORT_CONFIGS
+    from date_partitions import build_date_partitions
+
     print("""
 ╔══════════════════════════════════════════════════════════════╗
 ║   Step 1: Shared BM25 Matrix for UK + US                     ║
@@ -201,7 +344,9 @@ def main():
     DEFAULT_UK = "UK_british_debates_text_files_normalize"
     DEFAULT_US = "US_congressional_speeches_Text_Files"
     DEFAULT_OUTPUT = "uk_us_outputs"
+    DEFAULT_MANIFEST = "corpus_manifest.csv"
 
+    MANIFEST = input(f"Enter path to corpus manifest [{DEFAULT_MANIFEST}]: ").strip()
     UK_FOLDER = input(f"Enter path to UK folder [{DEFAULT_UK}]: ").strip()
     US_FOLDER = input(f"Enter path to US folder [{DEFAULT_US}]: ").strip()
     OUTPUT_FOLDER = input(f"Enter path for output folder [{DEFAULT_OUTPUT}]: ").strip()
@@ -209,16 +354,20 @@ def main():
     # If user just pressed Enter → use defaults
     UK_FOLDER = UK_FOLDER if UK_FOLDER else DEFAULT_UK
     US_FOLDER = US_FOLDER if US_FOLDER else DEFAULT_US
-    OUTPUT_FOLDER = OUTPUT_FOLDER if OUTPUT_FOLDER else DEFAULT_OUTPUT
-
+    MANIFEST = MANIFEST if MANIFEST else DEFAULT_MANIFEST
+    OUTPUT_FOLDER = Path(OUTPUT_FOLDER if OUTPUT_FOLDER else DEFAULT_OUTPUT)
+    OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
 
-   
 
     # === 2. Stopwords ===
     nltk_stopwords = get_nltk_stopwords()
 
     # === 3. Load UK + US documents into ONE DataFrame ===
-    df = load_country_documents(UK_FOLDER, US_FOLDER)
+    # Prefer the stage-1 manifest; fall back to scanning the folders.
+    if Path(MANIFEST).exists():
+        df = load_manifest_documents(MANIFEST)
+    else:
+        df = load_country_documents(UK_FOLDER, US_FOLDER)
     df = df.reset_index(drop=True)
     df["row_index"] = df.index  # mapping row -> doc
 
@@ -229,45 +378,50 @@ def main():
     BM25_MAX_DF = 0.95
     BM25_MAX_FEATURES = 20000
 
+    # Storage precision of the saved matrix: float64 / float32 / uint8 / uint16
+    # (uint* use linear impact quantization, scale per "global" or "per_term")
+    BM25_STORAGE = "float32"
+    BM25_SCALE_MODE = "global"
+
+    # Opt-in: precision agreement report (7 KMeans fits + sampled queries)
+    BM25_STORAGE_REPORT = False
+
+    # Opt-in: cache the TF-IDF matrix for fast k1, b sweeps (bm25_sweep.py);
+    # doc lengths + idf are always saved
+    BM25_SAVE_TF_CACHE = False
+
+    # Date partitions for time-range pruning: "month" / "year" / None
+    BM25_DATE_PARTITION = "month"
+
     X_bm25, feature_names, vectorizer, stats = build_bm25_matrix(
         documents=documents,
         stopwords_set=nltk_stopwords,
         min_df=BM25_MIN_DF,
         max_df=BM25_MAX_DF,
         max_features=BM25_MAX_FEATURES,
-        matrix_name="BM25-UK-US"
+        matrix_name="BM25-UK-US",
+        output_folder=OUTPUT_FOLDER,
+        tf_cache=BM25_SAVE_TF_CACHE,
     )
 
-    # === 5. Create labels vector y ===
-    # Option 1: keep as strings "UK"/"US"
-    y_str = df["country"].values
-
-    # Option 2: numeric labels 0=UK, 1=US (useful for sklearn)
-    label_map = {"UK": 0, "US": 1}
-    y_num = df["country"].map(label_map).values
-
-    # === 6. Save everything ===
-    print("\n💾 Saving outputs...")
+    # === 5. Save everything (labels, matrix, vocab, metadata, stats) ===
+    save_bm25_outputs(OUTPUT_FOLDER, X_bm25, feature_names, df, stats,
+                      storage=BM25_STORAGE, scale_mode=BM25_SCALE_MODE)
 
-    # BM25 matrix
-    save_npz(OUTPUT_FOLDER / "X_bm25_uk_us.npz", X_bm25)
+    if BM25_DATE_PARTITION:
+        build_date_partitions(X_bm25, df, OUTPUT_FOLDER / "date_partitions",
+                              period=BM25_DATE_PARTITION,
+                              storage=BM25_STORAGE, scale_mode=BM25_SCALE_MODE)
 
-    # labels
-    np.save(OUTPUT_FOLDER / "y_labels_str.npy", y_str)
-    np.save(OUTPUT_FOLDER / "y_labels_num.npy", y_num)
-
-    # feature names (vocabulary)
-    with open(OUTPUT_FOLDER / "bm25_feature_names.txt", "w", encoding="utf-8") as f:
-        f.write("\n".join(feature_names))
-
-    # DataFrame mapping (text + metadata)
-    df.to_csv(OUTPUT_FOLDER / "documents_metadata.csv", index=False)
-
-    # Stats
-    pd.DataFrame([stats]).to_csv(OUTPUT_FOLDER / "bm25_stats.csv", index=False)
+    # Ranking / clustering agreement of every storage precision vs float64
+    if BM25_STORAGE_REPORT:
+        print("\n📏 Measuring storage precision agreement vs float64...")
+        report = pd.DataFrame(storage_agreement_report(X_bm25, DEFAULT_REPORT_CONFIGS))
+        report.to_csv(OUTPUT_FOLDER / "bm25_storage_report.csv", index=False)
+        print(report.to_string(index=False))
 
     print("\n🎉 Done!")
-    print(f"   • X matrix: {OUTPUT_FOLDER / 'X_bm25_uk_us.npz'}")
+    print(f"   • X matrix: {OUTPUT_FOLDER / 'X_bm25_uk_us.npz'} ({stats['storage']})")
     print(f"   • y (str):  {OUTPUT_FOLDER / 'y_labels_str.npy'}")
     print(f"   • y (num):  {OUTPUT_FOLDER / 'y_labels_num.npy'}")
     print(f"   • metadata: {OUTPUT_FOLDER / 'documents_metadata.csv'}")
@@ -0,0 +1,221 @@
+"""
+Date-Partitioned BM25 Index
+===========================
+
+Document filenames carry their date (UK_debates2023-06-28.txt,
+US_2023-07-03.txt). This module splits the stage-2 BM25 matrix into one
+partition per month (or year):
+
+    date_partitions/
+        partitions.csv            partition, start_date, end_date, num_documents, matrix_file
+        X_bm25_2023-07.npz        rows of that period (same columns / vocabulary)
+        X_bm25_2023-07_rows.npy   global row_index of every partition row
+        X_bm25_2023-07_dates.npy  YYYY-MM-DD of every partition row
+
+A date-range query / clustering run only loads the partitions that
+overlap the range; all other partitions are never read or scored.
+"""
+
+import re
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+
+from bm25_storage import save_bm25_matrix, load_bm25_matrix
+from search import score_query, top_k
+
+
+PARTITIONS_FILE = "partitions.csv"
+UNDATED = "undated"
+DATE_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2})")
+DATE_BOUND_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+# ----------------------------------------------------
+# Dates -> partition keys
+# ----------------------------------------------------
+def document_dates(metadata_df):
+    """YYYY-MM-DD per row: the "date" column if present, else parsed from filename."""
+    if "date" in metadata_df.columns:
+        dates = metadata_df["date"].fillna("").astype(str)
+    else:
+        dates = metadata_df["filename"].astype(str).map(
+            lambda name: (DATE_PATTERN.search(name) or [""])[0]
+        )
+    return dates.to_numpy()
+
+
+def partition_key(date, period="month"):
+    if not date:
+        return UNDATED
+    return date[:7] if period == "month" else date[:4]
+
+
+# ----------------------------------------------------
+# Build
+# ----------------------------------------------------
+def build_date_partitions(X, metadata_df, out_dir, period="month",
+                          storage="float32", scale_mode="global"):
+    """
+    Writes one partition per period (rows sorted by date inside it).
+    Returns the partitions table.
+    """
+    import pandas as pd
+
+    if period not in ("month", "year"):
+        raise ValueError(f"Unknown period: {period}")
+
+    X = csr_matrix(X)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for old in out_dir.glob("X_bm25_*"):
+        old.unlink()  # partitions of an older build / other period
+
+    dates = document_dates(metadata_df)
+    keys = np.array([partition_key(d, period) for d in dates], dtype=object)
+
+    print(f"\n🗓️  Partitioning {X.shape[0]} documents by {period}...")
+    rows = []
+    for key in sorted(set(keys)):
+        part_rows = np.flatnonzero(keys == key)
+        part_rows = part_rows[np.argsort(dates[part_rows], kind="stable")]
+        part_dates = dates[part_rows]
+
+        name = f"X_bm25_{key}"
+        save_bm25_matrix(out_dir / f"{name}.npz", X[part_rows],
+                         precision=storage, scale_mode=scale_mode)
+        np.save(out_dir / f"{name}_rows.npy", part_rows.astype(np.int64))
+        np.save(out_dir / f"{name}_dates.npy", part_dates.astype(str))
+
+        rows.append({
+            "partition": key,
+            "start_date": part_dates[0] if key != UNDATED else "",
+            "end_date": part_dates[-1] if key != UNDATED else "",
+            "num_documents": len(part_rows),
+            "matrix_file": f"{name}.npz",
+        })
+
+    partitions = pd.DataFrame(rows)
+    partitions.to_csv(out_dir / PARTITIONS_FILE, index=False)
+    print(f"✅ {len(partitions)} partitions saved to: {out_dir}")
+    return partitions
+
+
+# ----------------------------------------------------
+# Partition pruning
+# ----------------------------------------------------
+def parse_date_bound(value):
+    """
+    Validates a --date-from / --date-to value: a real YYYY-MM-DD date
+    (None passes through). Bounds are compared as strings against the
+    partition dates, so "2023-07" or "2023-7-1" must be rejected.
+    """
+    if value is None:
+        return None
+    if not DATE_BOUND_PATTERN.fullmatch(value):
+        raise ValueError(f"Date must be YYYY-MM-DD, got: {value!r}")
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError as e:  # e.g. 2023-02-30
+        raise ValueError(f"Invalid date {value!r}: {e}") from None
+
+
+def parse_date_range(date_from=None, date_to=None):
+    date_from, date_to = parse_date_bound(date_from), parse_date_bound(date_to)
+    if date_from and date_to and date_from > date_to:
+        raise ValueError(f"date_from {date_from} is after date_to {date_to}")
+    return date_from, date_to
+
+
+def load_partitions_table(partition_dir):
+    import pandas as pd
+
+    return pd.read_csv(Path(partition_dir) / PARTITIONS_FILE,
+                       dtype=str, keep_default_na=False)
+
+
+def select_partitions(partitions, date_from=None, date_to=None):
+    """
+    Partitions overlapping [date_from, date_to] (inclusive, YYYY-MM-DD).
+    Without a range every partition is selected; with a range undated
+    documents are skipped.
+    """
+    date_from, date_to = parse_date_range(date_from, date_to)
+    if date_from is None and date_to is None:
+        return partitions
+
+    dated = partitions[partitions["partition"] != UNDATED]
+    mask = np.ones(len(dated), dtype=bool)
+    if date_from is not None:
+        mask &= dated["end_date"].to_numpy() >= date_from
+    if date_to is not None:
+        mask &= dated["start_date"].to_numpy() <= date_to
+    return dated[mask]
+
+
+def load_partition(partition_dir, matrix_file):
+    partition_dir = Path(partition_dir)
+    stem = matrix_file[:-len(".npz")]
+    X = load_bm25_matrix(partition_dir / matrix_file)
+    rows = np.load(partition_dir / f"{stem}_rows.npy")
+    dates = np.load(partition_dir / f"{stem}_dates.npy")
+    return X, rows, dates
+
+
+def iter_date_range(partition_dir, date_from=None, date_to=None):
+    """
+    Yields (X_part, row_index, dates) for every selected partition.
+    Boundary partitions are trimmed to the exact range (dates are sorted).
+    """
+    date_from, date_to = parse_date_range(date_from, date_to)
+    selected = select_partitions(load_partitions_table(partition_dir), date_from, date_to)
+    for matrix_file in selected["matrix_file"]:
+        X, rows, dates = load_partition(partition_dir, matrix_file)
+        lo = 0 if date_from is None else np.searchsorted(dates, date_from, side="left")
+        hi = len(dates) if date_to is None else np.searchsorted(dates, date_to, side="right")
+        if hi > lo:
+            yield X[lo:hi], rows[lo:hi], dates[lo:hi]
+
+
+def load_date_range(partition_dir, date_from=None, date_to=None):
+    """
+    Stacks the documents of [date_from, date_to] into one matrix.
+    Returns (X, row_index, dates); row_index maps back to the full index.
+    """
+    blocks, rows, dates = [], [], []
+    for X, r, d in iter_date_range(partition_dir, date_from, date_to):
+        blocks.append(X)
+        rows.append(r)
+        dates.append(d)
+
+    if not blocks:
+        raise ValueError(f"No documents between {date_from} and {date_to}")
+
+    print(f"🗓️  Loaded {len(blocks)} partitions, "
+          f"{sum(b.shape[0] for b in blocks)} documents ({date_from} → {date_to})")
+    return vstack(blocks).tocsr(), np.concatenate(rows), np.concatenate(dates)
+
+
+def search_date_range(partition_dir, term_ids, k=10, date_from=None, date_to=None):
+    """
+    Top-k BM25 search restricted to a date range. Each selected partition
+    is scored on its own; non-matching partitions are never loaded.
+    Returns (row_index, scores) in the full-index numbering, best first.
+    """
+    best_rows, best_scores = [], []
+    for X, rows, _ in iter_date_range(partition_dir, date_from, date_to):
+        scores = score_query(X, term_ids)
+        top = top_k(scores, k)
+        best_rows.append(rows[top])
+        best_scores.append(scores[top])
+
+    if not best_rows:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+    rows = np.concatenate(best_rows)
+    scores = np.concatenate(best_scores)
+    order = np.lexsort((rows, -scores))[:k]
+    keep = scores[order] > 0
+    return rows[order][keep], scores[order][keep]
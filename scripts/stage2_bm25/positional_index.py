@@ -0,0 +1,379 @@
+"""
+Positional Index (phrases, proximity, snippets)
+===============================================
+
+Optional layer next to the BM25 matrix. For every (term, document) it
+keeps the token positions and the BYTE offsets of each occurrence in the
+source file, so that:
+
+- phrase queries ("cost of living") check consecutive positions
+- proximity queries check that all terms fall inside a token window
+- snippets seek straight to the byte offset in the source text file
+  (no re-reading or re-scanning of whole documents)
+
+Tokens are the same as in stage 2 (lowercase, \\b\\w+\\b). By default
+EVERY token is indexed, stopwords included, so phrase matches are exact.
+With --skip-stopwords the stopwords are left out (smaller index) but
+still count as positions: a query stopword then matches any word at its
+position, and phrase results are reported as approximate. Any other query
+token that is not in the index means the phrase cannot match.
+
+Storage (positional/):
+    positions.bin       per-term postings, LEB128 varint compressed:
+                        n_docs, then per doc: doc_gap, tf, tf x pos_gap, tf x byte_gap
+    pos_terms.txt       term of every postings blob (sorted)
+    pos_stopwords.txt   stopwords left out at build time (empty: none)
+    pos_offsets.npy     blob start in positions.bin (len = terms + 1)
+    pos_sources.txt     source file of every doc id (relative to this folder)
+    pos_rows.npy        manifest row_index of every doc id
+
+Usage:
+    python positional_index.py build  --manifest corpus_manifest.csv --index uk_us_outputs/positional
+    python positional_index.py phrase "cost of living" --index uk_us_outputs/positional
+    python positional_index.py near border security --window 5
+"""
+
+import argparse
+import os
+import re
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "stage1_prepering_data"))
+from corpus_manifest import read_manifest_rows, iter_manifest_documents
+
+
+TOKEN_RE = re.compile(r"(?u)\b\w+\b")
+TOKEN_SPLIT_RE = re.compile(r"(?u)\b(\w+)\b")  # split() keeps the tokens
+
+
+# ----------------------------------------------------
+# Varint (LEB128) coding, vectorized with numpy
+# ----------------------------------------------------
+def varint_encode(values):
+    values = np.asarray(values, dtype=np.uint64)
+    if values.size == 0:
+        return b""
+    nbytes = np.ones(values.shape, dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+
+    starts = np.concatenate([[0], np.cumsum(nbytes)[:-1]])
+    out = np.zeros(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(int(nbytes.max())):
+        has = nbytes > k
+        chunk = (values[has] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (nbytes[has] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[has] + k] = (chunk | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def varint_decode(data):
+    b = np.frombuffer(data, dtype=np.uint8)
+    if b.size == 0:
+        return np.array([], dtype=np.int64)
+    last = (b & 0x80) == 0
+    value_id = np.concatenate([[0], np.cumsum(last)[:-1]])
+    group_start = np.concatenate([[0], np.flatnonzero(last)[:-1] + 1])
+    shift = (np.arange(b.size) - group_start[value_id]) * 7
+    parts = (b & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.add.reduceat(parts, group_start).astype(np.int64)
+
+
+# ----------------------------------------------------
+# Tokenization with positions and byte offsets
+# ----------------------------------------------------
+def tokenize_with_offsets(raw):
+    """
+    raw: file bytes. Returns (tokens, byte_offsets); token i is the i-th
+    token of the document (its position). Decoding uses surrogateescape,
+    so byte offsets stay exact even for invalid utf-8.
+    """
+    text = raw.decode("utf-8", errors="surrogateescape")
+
+    # [gap, token, gap, token, ..., gap]: lengths give every token start
+    pieces = TOKEN_SPLIT_RE.split(text)
+    tokens = pieces[1::2]
+    char_starts = np.cumsum(np.fromiter(map(len, pieces), dtype=np.int64,
+                                        count=len(pieces)))[0::2][:-1]
+    tokens = "\n".join(tokens).lower().split("\n") if tokens else []
+
+    if len(text) == len(raw):  # pure ASCII: char offset == byte offset
+        return tokens, char_starts
+
+    # utf-8 length of every character, from its code point
+    code_points = np.frombuffer(text.encode("utf-32-le", errors="surrogatepass"),
+                                dtype=np.uint32)
+    char_bytes = (1 + (code_points >= 0x80) + (code_points >= 0x800)
+                  + (code_points >= 0x10000)).astype(np.int64)
+    char_bytes[(code_points >= 0xDC80) & (code_points <= 0xDCFF)] = 1  # escaped raw bytes
+    byte_at = np.concatenate([[0], np.cumsum(char_bytes)])
+    return tokens, byte_at[char_starts]
+
+
+def doc_postings(tokens, offsets):
+    """
+    Groups one document's tokens by term. Returns (terms, blocks): blocks[g]
+    is the encoded posting of terms[g] = [doc_gap (filled later), tf,
+    tf x position gap, tf x byte gap], all views into one per-document array.
+    """
+    terms, term_ids = np.unique(np.array(tokens), return_inverse=True)
+    order = np.argsort(term_ids, kind="stable")  # positions stay increasing
+    tf = np.bincount(term_ids, minlength=len(terms))
+    group_start = np.concatenate([[0], np.cumsum(tf)[:-1]])
+
+    # gaps inside each group; the first gap of a group is absolute
+    pos_gaps = np.diff(order, prepend=0)
+    off_sorted = offsets[order]
+    off_gaps = np.diff(off_sorted, prepend=0)
+    pos_gaps[group_start] = order[group_start]
+    off_gaps[group_start] = off_sorted[group_start]
+
+    # layout: group g starts at 2 * g + 2 * group_start[g]
+    block_start = 2 * np.arange(len(terms)) + 2 * group_start
+    group_of = np.repeat(np.arange(len(terms)), tf)
+    rank = np.arange(len(order)) - group_start[group_of]
+    pos_slot = block_start[group_of] + 2 + rank
+
+    layout = np.zeros(2 * len(terms) + 2 * len(order), dtype=np.int64)
+    layout[block_start + 1] = tf
+    layout[pos_slot] = pos_gaps
+    layout[pos_slot + tf[group_of]] = off_gaps
+
+    block_end = block_start + 2 + 2 * tf
+    blocks = [layout[start:end] for start, end in zip(block_start.tolist(), block_end.tolist())]
+    return terms.tolist(), blocks
+
+
+# ----------------------------------------------------
+# Build
+# ----------------------------------------------------
+def build_positional_index(manifest_path, out_dir, stopwords_set=frozenset()):
+    """
+    Reads every manifest document once (as bytes) and writes the
+    compressed positional postings. Terms in stopwords_set are not
+    indexed but still count as positions; the set is saved with the index.
+    """
+    manifest_path = Path(manifest_path)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # term -> list of (doc_id, encoded posting block), see doc_postings
+    postings = defaultdict(list)
+    sources, rows = [], []
+
+    manifest_rows = read_manifest_rows(manifest_path)
+
+    print(f"\n📍 Building positional index for {len(manifest_rows)} documents...")
+    for row, raw in iter_manifest_documents(manifest_path, manifest_rows, raw=True):
+        tokens, offsets = tokenize_with_offsets(raw)
+
+        doc_id = len(sources)
+        sources.append(os.path.relpath(manifest_path.parent / row["source_path"], out_dir))
+        rows.append(row["row_index"])
+        if not tokens:
+            continue
+
+        for term, block in zip(*doc_postings(tokens, offsets)):
+            if term not in stopwords_set:
+                postings[term].append((doc_id, block))
+
+    terms = sorted(postings)
+    blob_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    with open(out_dir / "positions.bin", "wb", buffering=1 << 20) as f:
+        for i, term in enumerate(terms):
+            doc_ids, blocks = zip(*postings.pop(term))
+            for block, gap in zip(blocks, np.diff(doc_ids, prepend=0).tolist()):
+                block[0] = gap
+            blob = varint_encode(np.concatenate([[len(blocks)], *blocks]))
+            f.write(blob)
+            blob_offsets[i + 1] = blob_offsets[i] + len(blob)
+
+    np.save(out_dir / "pos_offsets.npy", blob_offsets)
+    np.save(out_dir / "pos_rows.npy", np.array(rows, dtype=np.int64))
+    with open(out_dir / "pos_terms.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(terms))
+    with open(out_dir / "pos_sources.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(sources))
+    with open(out_dir / "pos_stopwords.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(sorted(stopwords_set)))
+
+    size_mb = blob_offsets[-1] / 1e6
+    print(f"✅ Positional index: {len(sources)} docs, {len(terms)} terms, {size_mb:.1f} MB")
+    return out_dir
+
+
+# ----------------------------------------------------
+# Query
+# ----------------------------------------------------
+class PositionalIndex:
+    """
+    Read-only access to a positional index folder. positions.bin is read
+    with seek() per term, so only the postings of the query terms are loaded.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / "pos_terms.txt", "r", encoding="utf-8") as f:
+            self.terms = {t: i for i, t in enumerate(f.read().split("\n"))}
+        with open(self.index_dir / "pos_sources.txt", "r", encoding="utf-8") as f:
+            self.sources = f.read().split("\n")
+        with open(self.index_dir / "pos_stopwords.txt", "r", encoding="utf-8") as f:
+            self.skipped_stopwords = frozenset(f.read().split("\n")) - {""}
+        self.blob_offsets = np.load(self.index_dir / "pos_offsets.npy")
+        self.rows = np.load(self.index_dir / "pos_rows.npy")
+
+    def postings(self, term):
+        """{doc_id: (positions, byte_offsets)} for one term ({} if unknown)."""
+        i = self.terms.get(term)
+        if i is None:
+            return {}
+        start, end = self.blob_offsets[i], self.blob_offsets[i + 1]
+        with open(self.index_dir / "positions.bin", "rb") as f:
+            f.seek(start)
+            values = varint_decode(f.read(end - start))
+
+        result, doc_id, p = {}, 0, 1
+        for _ in range(values[0]):
+            doc_id += values[p]
+            tf = values[p + 1]
+            positions = np.cumsum(values[p + 2:p + 2 + tf])
+            offsets = np.cumsum(values[p + 2 + tf:p + 2 + 2 * tf])
+            result[doc_id] = (positions, offsets)
+            p += 2 + 2 * tf
+        return result
+
+    def parse_phrase(self, phrase):
+        """
+        Returns (query, gaps): query = [(position offset, term), ...] of the
+        indexed tokens, gaps = stopwords skipped at build time (they match
+        any word). query is None when any other token is not in the index.
+        """
+        query, gaps = [], []
+        for i, token in enumerate(t.lower() for t in TOKEN_RE.findall(phrase)):
+            if token in self.terms:
+                query.append((i, token))
+            elif token in self.skipped_stopwords:
+                gaps.append(token)
+            else:
+                return None, gaps
+        return query, gaps
+
+    def phrase_search(self, phrase):
+        """
+        Phrase matches. Returns {doc_id: [(position, byte_offset), ...]}:
+        position is the token position where the phrase starts, byte_offset
+        the start of its first indexed term in the source file. Leading
+        stopwords skipped at build time have no stored offset, so the match
+        starts a few words before byte_offset (inside the snippet context).
+        Exact unless the phrase has stopwords skipped at build time.
+        """
+        query, _ = self.parse_phrase(phrase)
+        if not query:
+            return {}
+        lists = [(gap, self.postings(t)) for gap, t in query]
+        docs = set.intersection(*(set(p) for _, p in lists))
+
+        first_gap = query[0][0]
+        matches = {}
+        for doc in sorted(docs):
+            first_pos, first_off = lists[0][1][doc]
+            starts = first_pos - first_gap
+            ok = np.ones(len(starts), dtype=bool)
+            for gap, plist in lists[1:]:
+                ok &= np.isin(starts + gap, plist[doc][0])
+            if ok.any():
+                matches[doc] = list(zip(starts[ok].tolist(), first_off[ok].tolist()))
+        return matches
+
+    def proximity_search(self, terms, window=10):
+        """
+        Documents where all terms occur within `window` consecutive tokens.
+        Stopwords skipped at build time are ignored.
+        Returns {doc_id: [(start_position, start_byte_offset), ...]}.
+        """
+        terms = [t.lower() for t in terms if t.lower() not in self.skipped_stopwords]
+        lists = [self.postings(t) for t in terms]
+        if not lists or any(not p for p in lists):
+            return {}
+        docs = set.intersection(*(set(p) for p in lists))
+
+        matches = {}
+        for doc in sorted(docs):
+            events = sorted(
+                (pos, off, k)
+                for k, plist in enumerate(lists)
+                for pos, off in zip(*plist[doc])
+            )
+            counts, covered, left, found = [0] * len(terms), 0, 0, []
+            for pos, _, k in events:
+                counts[k] += 1
+                covered += counts[k] == 1
+                while covered == len(terms):
+                    l_pos, l_off, l_k = events[left]
+                    if pos - l_pos < window:
+                        found.append((l_pos, l_off))
+                    counts[l_k] -= 1
+                    covered -= counts[l_k] == 0
+                    left += 1
+            if found:
+                matches[doc] = sorted(set(found))
+        return matches
+
+    def snippet(self, doc_id, byte_offset, context=120):
+        """Text around byte_offset, read with one seek in the source file."""
+        path = self.index_dir / self.sources[doc_id]
+        start = max(0, byte_offset - context)
+        with open(path, "rb") as f:
+            f.seek(start)
+            raw = f.read(byte_offset - start + 2 * context)
+        text = raw.decode("utf-8", errors="ignore")
+        return " ".join(text.split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Positional index: phrases, proximity, snippets")
+    parser.add_argument("step", choices=["build", "phrase", "near"])
+    parser.add_argument("query", nargs="*")
+    parser.add_argument("--manifest", default="corpus_manifest.csv")
+    parser.add_argument("--index", default="uk_us_outputs/positional")
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--skip-stopwords", action="store_true",
+                        help="do not index stopwords (smaller index, approximate phrases)")
+    args = parser.parse_args()
+
+    if args.step == "build":
+        stopwords_set = frozenset()
+        if args.skip_stopwords:
+            from build_bm25 import load_stopwords_snapshot
+            stopwords_set = load_stopwords_snapshot()
+        build_positional_index(args.manifest, args.index, stopwords_set)
+        return
+
+    index = PositionalIndex(args.index)
+    note = ""
+    if args.step == "phrase":
+        phrase = " ".join(args.query)
+        matches = index.phrase_search(phrase)
+        _, gaps = index.parse_phrase(phrase)
+        if gaps:
+            note = f" (approximate: stopwords {gaps} not indexed, matched as any word)"
+    else:
+        matches = index.proximity_search(args.query, window=args.window)
+
+    total = sum(len(m) for m in matches.values())
+    print(f"\n🔎 {total} matches in {len(matches)} documents{note}")
+    for doc_id, hits in sorted(matches.items(), key=lambda kv: -len(kv[1]))[:args.limit]:
+        _, offset = hits[0]
+        print(f"\n• {Path(index.sources[doc_id]).name}  ({len(hits)} matches)")
+        print(f"  …{index.snippet(doc_id, offset)}…")
+
+
+if __name__ == "__main__":
+    main()
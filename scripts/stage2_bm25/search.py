@@ -0,0 +1,116 @@
+"""
+BM25 Query Scoring
+==================
+
+Minimal retrieval over the stage-2 BM25 matrix:
+- Query terms are tokenized like the vectorizer (lowercase, \\b\\w+\\b)
+- A document's score = sum of its BM25 weights for the query terms
+- Top-k documents are returned (highest score first)
+
+Usage:
+    python search.py "cost of living" --k 10
+    python search.py "border security" --date-from 2024-01-01 --date-to 2024-03-31
+"""
+
+import argparse
+import csv
+import re
+from pathlib import Path
+
+import numpy as np
+
+
+TOKEN_PATTERN = re.compile(r"(?u)\b\w+\b")
+
+
+def load_feature_names(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f]
+
+
+def encode_query(query, feature_names, stopwords_set=()):
+    """
+    Maps a free-text query to vocabulary column ids.
+    Unknown terms and stopwords are ignored; duplicates are kept once.
+    """
+    vocab = feature_names if isinstance(feature_names, dict) else \
+        {term: i for i, term in enumerate(feature_names)}
+
+    term_ids = []
+    for token in TOKEN_PATTERN.findall(query.lower()):
+        if token in stopwords_set:
+            continue
+        idx = vocab.get(token)
+        if idx is not None and idx not in term_ids:
+            term_ids.append(idx)
+    return np.array(term_ids, dtype=np.int64)
+
+
+def score_query(X, term_ids):
+    """BM25 score of every row of X for the given term ids."""
+    if len(term_ids) == 0:
+        return np.zeros(X.shape[0], dtype=np.float32)
+    return np.asarray(X[:, term_ids].sum(axis=1)).ravel()
+
+
+def top_k(scores, k=10):
+    """Indices of the k highest scores (ties broken by row index), best first."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+def search(X, term_ids, k=10):
+    """Returns (row_ids, scores) of the top-k documents, dropping zero scores."""
+    scores = score_query(X, term_ids)
+    rows = top_k(scores, k)
+    rows = rows[scores[rows] > 0]
+    return rows, scores[rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 search over the stage-2 index")
+    parser.add_argument("query")
+    parser.add_argument("--index", default="uk_us_outputs")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--date-from", default=None)
+    parser.add_argument("--date-to", default=None)
+    args = parser.parse_args()
+
+    if args.date_from or args.date_to:
+        from date_partitions import parse_date_range
+        try:
+            parse_date_range(args.date_from, args.date_to)
+        except ValueError as e:
+            parser.error(str(e))
+
+    # Light imports only: the bundled stopword snapshot, no nltk / pandas / sklearn
+    from build_bm25 import load_stopwords_snapshot
+
+    index = Path(args.index)
+    term_ids = encode_query(args.query, load_feature_names(index / "bm25_feature_names.txt"),
+                            load_stopwords_snapshot())
+    if len(term_ids) == 0:
+        print("No query term is in the index vocabulary.")
+        return
+
+    if args.date_from or args.date_to:
+        from date_partitions import search_date_range
+        rows, scores = search_date_range(index / "date_partitions", term_ids, args.k,
+                                         args.date_from, args.date_to)
+    else:
+        from bm25_storage import load_bm25_matrix
+        rows, scores = search(load_bm25_matrix(index / "X_bm25_uk_us.npz"), term_ids, args.k)
+
+    with open(index / "documents_metadata.csv", "r", encoding="utf-8") as f:
+        filenames = [row["filename"] for row in csv.DictReader(f)]
+
+    for rank, (row, score) in enumerate(zip(rows, scores), start=1):
+        print(f"{rank:>3}. {score:8.3f}  {filenames[row]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Sharded BM25 Build (map -> reduce)
+==================================
+
+Same result as build_bm25_matrix, but the corpus manifest is split into
+shards that are counted independently (in processes or on other machines):
+
+MAP    (one call per shard)
+    - reads its slice of corpus_manifest.csv
+    - CountVectorizer with a LOCAL vocabulary, no df limits
+    - writes plain files into the shard folder:
+        shard_0003.npz         raw term counts (docs x local terms)
+        shard_0003_vocab.txt   local vocabulary (one term per line)
+        shard_0003_rows.npy    manifest row_index of every kept document
+        shard_0003_meta.json   shard_id, num_shards, manifest sha1
+
+REDUCE (local)
+    - checks that shards 0..num_shards-1 are all present and were cut
+      from the same manifest with the same --shards (no partial index)
+    - merges the local vocabularies, computes global df / term counts
+    - applies min_df / max_df / max_features exactly like sklearn
+    - remaps every shard into the final columns, then TF-IDF -> BM25
+
+Usage:
+    python sharded_build.py local  --manifest corpus_manifest.csv --shards 8 --workers 8
+    python sharded_build.py map    --manifest corpus_manifest.csv --shards 8 --shard-id 3
+    python sharded_build.py reduce --manifest corpus_manifest.csv
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from numbers import Integral
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack, save_npz, load_npz
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "stage1_prepering_data"))
+from corpus_manifest import (
+    load_manifest, read_manifest_rows, iter_manifest_documents, file_content_hash
+)
+
+
+DEFAULT_SHARD_DIR = "bm25_shards"
+
+
+def shard_prefix(shard_dir, shard_id):
+    return Path(shard_dir) / f"shard_{shard_id:04d}"
+
+
+def shard_rows(n_docs, num_shards, shard_id):
+    """Contiguous manifest rows of one shard (keeps the global row order)."""
+    return np.array_split(np.arange(n_docs), num_shards)[shard_id]
+
+
+# ----------------------------------------------------
+# MAP: one shard -> raw counts with a local vocabulary
+# ----------------------------------------------------
+def build_shard(manifest_path, shard_id, num_shards, shard_dir, stopwords_set):
+    from sklearn.feature_extraction.text import CountVectorizer
+    from build_bm25 import TOKEN_PATTERN
+
+    rows = read_manifest_rows(manifest_path)
+    part = [rows[i] for i in shard_rows(len(rows), num_shards, shard_id)]
+
+    texts, kept_rows = [], []
+    for row, text in iter_manifest_documents(manifest_path, part):
+        texts.append(text)
+        kept_rows.append(row["row_index"])
+
+    vectorizer = CountVectorizer(
+        stop_words=list(stopwords_set),
+        lowercase=True,
+        token_pattern=TOKEN_PATTERN,
+        ngram_range=(1, 1),
+        dtype=np.int32,
+    )
+    if texts:
+        counts = vectorizer.fit_transform(texts).tocsr()
+        vocab = vectorizer.get_feature_names_out()
+    else:
+        counts = csr_matrix((0, 0), dtype=np.int32)
+        vocab = []
+
+    Path(shard_dir).mkdir(parents=True, exist_ok=True)
+    prefix = shard_prefix(shard_dir, shard_id)
+    save_npz(f"{prefix}.npz", counts)
+    np.save(f"{prefix}_rows.npy", np.array(kept_rows, dtype=np.int64))
+    with open(f"{prefix}_vocab.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab))
+    # Written last: a shard without meta is treated as incomplete
+    with open(f"{prefix}_meta.json", "w", encoding="utf-8") as f:
+        json.dump({"shard_id": shard_id, "num_shards": num_shards,
+                   "manifest_sha1": file_content_hash(manifest_path)}, f)
+
+    print(f"✅ Shard {shard_id}/{num_shards}: {counts.shape[0]} docs, {len(vocab)} local terms")
+    return str(prefix)
+
+
+def load_shard_vocab(prefix):
+    with open(f"{prefix}_vocab.txt", "r", encoding="utf-8") as f:
+        text = f.read()
+    return np.array(text.split("\n") if text else [], dtype=object)
+
+
+def load_shard(prefix):
+    counts = load_npz(f"{prefix}.npz").tocsr()
+    rows = np.load(f"{prefix}_rows.npy")
+    return counts, load_shard_vocab(prefix), rows
+
+
+def list_shards(shard_dir):
+    return sorted(str(p)[:-len(".npz")] for p in Path(shard_dir).glob("shard_*.npz"))
+
+
+def check_shards(shard_dir, manifest_path):
+    """
+    Shard prefixes 0..num_shards-1 in order. Raises ValueError if a shard
+    is missing or incomplete, or if the shards disagree on num_shards or
+    were built from a different manifest than `manifest_path`.
+    """
+    prefixes = list_shards(shard_dir)
+    if not prefixes:
+        raise ValueError(f"No shards found in: {shard_dir}")
+
+    metas = {}
+    for prefix in prefixes:
+        try:
+            with open(f"{prefix}_meta.json", "r", encoding="utf-8") as f:
+                metas[prefix] = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"Shard {prefix} has no _meta.json (incomplete map step)") from None
+
+    num_shards = {m["num_shards"] for m in metas.values()}
+    if len(num_shards) != 1:
+        raise ValueError(f"Shards were built with different --shards: {sorted(num_shards)}")
+    num_shards = num_shards.pop()
+
+    manifest_sha1 = file_content_hash(manifest_path)
+    stale = [p for p, m in metas.items() if m["manifest_sha1"] != manifest_sha1]
+    if stale:
+        raise ValueError(f"{len(stale)} shards were built from a different manifest, "
+                         f"e.g. {stale[0]}")
+
+    by_id = {m["shard_id"]: p for p, m in metas.items()}
+    missing = sorted(set(range(num_shards)) - set(by_id))
+    extra = sorted(set(by_id) - set(range(num_shards)))
+    if missing or extra:
+        raise ValueError(f"Expected shards 0..{num_shards - 1}: "
+                         f"missing {missing}, unexpected {extra}")
+    return [by_id[i] for i in range(num_shards)]
+
+
+# ----------------------------------------------------
+# REDUCE: merge vocabularies, global df, limits, BM25
+# ----------------------------------------------------
+def merge_vocabularies(shard_prefixes):
+    """
+    First pass: global sorted vocabulary + global df and term counts.
+    Only vocabulary-sized arrays are kept in memory.
+    """
+    vocabs = [load_shard_vocab(prefix) for prefix in shard_prefixes]
+
+    global_vocab = np.array(sorted(set().union(*map(set, vocabs))), dtype=object)
+    df = np.zeros(len(global_vocab), dtype=np.int64)
+    tf = np.zeros(len(global_vocab), dtype=np.int64)
+    n_docs = 0
+
+    for prefix, vocab in zip(shard_prefixes, vocabs):
+        counts = load_npz(f"{prefix}.npz").tocsr()
+        n_docs += counts.shape[0]
+        if not len(vocab):
+            continue
+        to_global = np.searchsorted(global_vocab, vocab)
+        df += np.bincount(to_global[counts.indices], minlength=len(global_vocab))
+        tf += np.bincount(to_global[counts.indices], weights=counts.data,
+                          minlength=len(global_vocab)).astype(np.int64)
+
+    return global_vocab, df, tf, n_docs
+
+
+def df_limit(value):
+    """
+    argparse type for --min-df / --max-df with sklearn semantics:
+    "0.95" -> float (fraction of documents), "600" -> int (document count).
+    """
+    return float(value) if "." in value else int(value)
+
+
+def limit_features(df, tf, n_docs, min_df=5, max_df=0.95, max_features=20000):
+    """Same rule as sklearn's CountVectorizer._limit_features -> boolean mask."""
+    max_doc_count = max_df if isinstance(max_df, Integral) else max_df * n_docs
+    min_doc_count = min_df if isinstance(min_df, Integral) else min_df * n_docs
+    if max_doc_count < min_doc_count:
+        raise ValueError("max_df corresponds to < documents than min_df")
+
+    mask = (df <= max_doc_count) & (df >= min_doc_count)
+    if max_features is not None and mask.sum() > max_features:
+        mask_inds = (-tf[mask]).argsort()[:max_features]
+        new_mask = np.zeros(len(df), dtype=bool)
+        new_mask[np.where(mask)[0][mask_inds]] = True
+        mask = new_mask
+    if not mask.any():
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+    return mask
+
+
+def merge_shards(shard_prefixes, min_df=5, max_df=0.95, max_features=20000,
+                 matrix_name="BM25-UK-US", output_folder=None, tf_cache=False):
+    """
+    Returns (bm25_matrix, feature_names, row_index, idf, stats) with the same
+    values the single-process TfidfVectorizer + BM25 build produces.
+    """
+    from sklearn.preprocessing import normalize
+    from build_bm25 import tfidf_to_bm25, bm25_stats
+
+    print(f"\n{'='*70}")
+    print(f"🔨 Reducing {len(shard_prefixes)} shards -> {matrix_name}")
+    print(f"{'='*70}")
+
+    global_vocab, df, tf, n_docs = merge_vocabularies(shard_prefixes)
+    mask = limit_features(df, tf, n_docs, min_df, max_df, max_features)
+
+    feature_names = global_vocab[mask]
+    final_col = np.full(len(global_vocab), -1, dtype=np.int64)
+    final_col[mask] = np.arange(mask.sum())
+    print(f"   • {len(global_vocab)} merged terms -> {len(feature_names)} kept")
+
+    # Second pass: remap every shard into the final columns
+    blocks, rows = [], []
+    for prefix in shard_prefixes:
+        counts, vocab, shard_rows_ = load_shard(prefix)
+        rows.append(shard_rows_)
+        if not len(vocab):
+            blocks.append(csr_matrix((counts.shape[0], len(feature_names)), dtype=np.float64))
+            continue
+        cols = final_col[np.searchsorted(global_vocab, vocab)][counts.indices]
+        keep = cols >= 0
+        doc_of_entry = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        blocks.append(csr_matrix(
+            (counts.data[keep].astype(np.float64), (doc_of_entry[keep], cols[keep])),
+            shape=(counts.shape[0], len(feature_names)),
+        ))
+
+    counts = vstack(blocks).tocsr()
+    row_index = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+
+    # TF-IDF exactly like TfidfVectorizer(smooth_idf=True, norm="l2")
+    idf = np.log((1 + n_docs) / (1 + df[mask])) + 1
+    tfidf = normalize(counts.multiply(idf).tocsr(), norm="l2", copy=False)
+
+    bm25_matrix = tfidf_to_bm25(tfidf, idf, output_folder=output_folder, tf_cache=tf_cache)
+    stats = bm25_stats(bm25_matrix, matrix_name)
+    stats["num_shards"] = len(shard_prefixes)
+    return bm25_matrix, feature_names, row_index, idf, stats
+
+
+# ----------------------------------------------------
+# Local driver: map in parallel processes, then reduce
+# ----------------------------------------------------
+def build_local(manifest_path, num_shards, shard_dir, stopwords_set, workers=None):
+    workers = workers or os.cpu_count() or 1
+
+    # Shards from an older run (different --shards) would be merged too
+    for old in Path(shard_dir).glob("shard_*"):
+        old.unlink()
+
+    print(f"\n🗂️  Map: {num_shards} shards on {workers} worker processes")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(build_shard, manifest_path, i, num_shards, shard_dir, stopwords_set)
+            for i in range(num_shards)
+        ]
+        return [f.result() for f in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded BM25 build (map / reduce)")
+    parser.add_argument("step", choices=["local", "map", "reduce"])
+    parser.add_argument("--manifest", default="corpus_manifest.csv")
+    parser.add_argument("--shard-dir", default=DEFAULT_SHARD_DIR)
+    parser.add_argument("--shards", type=int, default=None,
+                        help="number of shards (required for map; local: cpu count)")
+    parser.add_argument("--shard-id", type=int, help="map step: which shard to build")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default="uk_us_outputs")
+    parser.add_argument("--min-df", type=df_limit, default=5,
+                        help="int = document count, float = fraction")
+    parser.add_argument("--max-df", type=df_limit, default=0.95,
+                        help="int = document count, float = fraction")
+    parser.add_argument("--max-features", type=int, default=20000)
+    parser.add_argument("--storage", default="float32")
+    parser.add_argument("--scale-mode", default="global")
+    parser.add_argument("--date-partition", choices=["month", "year", "none"], default="month")
+    parser.add_argument("--tf-cache", action="store_true",
+                        help="also save the TF-IDF matrix for bm25_sweep.py")
+    args = parser.parse_args()
+
+    if args.step in ("local", "map"):
+        from build_bm25 import get_nltk_stopwords
+        stopwords_set = get_nltk_stopwords()
+
+    if args.step == "map":
+        if args.shard_id is None or args.shards is None:
+            parser.error("map requires --shards and --shard-id")
+        if not 0 <= args.shard_id < args.shards:
+            parser.error("--shard-id must be in 0..shards-1")
+        build_shard(args.manifest, args.shard_id, args.shards, args.shard_dir, stopwords_set)
+        return
+
+    if args.step == "local":
+        build_local(args.manifest, args.shards or os.cpu_count() or 1,
+                    args.shard_dir, stopwords_set, args.workers)
+
+    # === Reduce ===
+    from build_bm25 import save_bm25_outputs
+
+    X_bm25, feature_names, row_index, idf, stats = merge_shards(
+        check_shards(args.shard_dir, args.manifest),
+        min_df=args.min_df,
+        max_df=args.max_df,
+        max_features=args.max_features,
+        output_folder=args.output,
+        tf_cache=args.tf_cache,
+    )
+
+    manifest = load_manifest(args.manifest)
+    df = manifest.set_index("row_index").loc[row_index,
+                                             ["country", "filename", "date", "source_path"]]
+    df = df.reset_index(drop=True)
+    df["row_index"] = df.index
+
+    save_bm25_outputs(args.output, X_bm25, feature_names, df, stats,
+                      storage=args.storage, scale_mode=args.scale_mode)
+
+    if args.date_partition != "none":
+        from date_partitions import build_date_partitions
+        build_date_partitions(X_bm25, df, Path(args.output) / "date_partitions",
+                              period=args.date_partition,
+                              storage=args.storage, scale_mode=args.scale_mode)
+    print(f"\n🎉 Done! Sharded BM25 index saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
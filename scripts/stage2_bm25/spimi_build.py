@@ -0,0 +1,389 @@
+"""
+External-Memory BM25 Build (SPIMI)
+==================================
+
+Single-pass in-memory indexing with a memory budget, for corpora that do
+not fit in RAM. Same tokenization, vocabulary limits and BM25 weights as
+build_bm25_matrix, but nothing corpus-sized is ever held in memory:
+
+1. INVERT   stream documents from corpus_manifest.csv, add (doc, tf) to an
+            in-memory term -> postings dictionary; when the budget is
+            reached, write it as a sorted run file and start a new one
+2. MERGE    streaming k-way merges (heapq) of at most --merge-fanin runs
+            at a time, in as many passes as needed -> one term-sorted
+            postings file + per-term df / total tf. Open files and read
+            buffers stay bounded by the fan-in and the memory budget.
+3. LIMIT    min_df / max_df / max_features on the merged statistics
+4. NORMS    one sequential pass: per-document TF-IDF l2 norm and length
+5. WEIGHTS  one sequential pass: BM25 weights written term by term into
+            memory-mapped CSC arrays (spimi_data / indices / indptr .npy)
+
+Only vocabulary-sized and document-count-sized arrays live in RAM.
+
+Run / postings file record (sequential, little-endian):
+    uint32 term_len | term utf-8 | uint32 n | int32 doc[n] | int32 tf[n]
+
+Usage:
+    python spimi_build.py --manifest corpus_manifest.csv --output uk_us_outputs/spimi --memory-mb 256
+    python spimi_build.py ... --export-npz uk_us_outputs   # also write the usual stage-2 outputs
+"""
+
+import argparse
+import heapq
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "stage1_prepering_data"))
+from corpus_manifest import iter_manifest_documents, load_manifest
+
+
+HEADER = struct.Struct("<I")
+
+# Rough CPython costs used for the memory budget
+BYTES_PER_POSTING = 8      # int32 doc + int32 tf in two array('i')
+BYTES_PER_TERM = 240       # dict slot + str + two array objects
+
+# Merge: runs open at once, and the per-run read buffer range
+MERGE_FANIN = 64
+MIN_READ_BUFFER = 4 * 1024
+MAX_READ_BUFFER = 1 << 20
+
+
+# ----------------------------------------------------
+# Run files
+# ----------------------------------------------------
+def write_postings(f, term, docs, tfs):
+    encoded = term.encode("utf-8")
+    f.write(HEADER.pack(len(encoded)))
+    f.write(encoded)
+    f.write(HEADER.pack(len(docs)))
+    f.write(np.asarray(docs, dtype="<i4").tobytes())
+    f.write(np.asarray(tfs, dtype="<i4").tobytes())
+
+
+def read_postings(path, buffer_size=1 << 20):
+    """Yields (term, docs, tfs) sequentially from a run / postings file."""
+    with open(path, "rb", buffering=buffer_size) as f:
+        while True:
+            head = f.read(HEADER.size)
+            if not head:
+                return
+            term = f.read(HEADER.unpack(head)[0]).decode("utf-8")
+            n = HEADER.unpack(f.read(HEADER.size))[0]
+            docs = np.frombuffer(f.read(4 * n), dtype="<i4")
+            tfs = np.frombuffer(f.read(4 * n), dtype="<i4")
+            yield term, docs, tfs
+
+
+def spill_run(dictionary, run_dir, run_id):
+    path = Path(run_dir) / f"run_{run_id:05d}.bin"
+    with open(path, "wb", buffering=1 << 20) as f:
+        for term in sorted(dictionary):
+            docs, tfs = dictionary[term]
+            write_postings(f, term, docs, tfs)
+    return path
+
+
+# ----------------------------------------------------
+# 1. INVERT: stream documents, spill sorted runs
+# ----------------------------------------------------
+def invert_documents(documents, stopwords_set, run_dir, memory_budget):
+    """
+    SPIMI inversion. documents yields (row_index, text).
+    Returns (run_paths, row_index of every doc id).
+    """
+    from build_bm25 import TOKEN_PATTERN
+
+    token_re = re.compile(TOKEN_PATTERN)
+    dictionary, used = {}, 0
+    runs, row_index = [], []
+
+    for doc_id, (row, text) in enumerate(documents):
+        row_index.append(row)
+        counts = Counter(t for t in token_re.findall(text.lower()) if t not in stopwords_set)
+        for term, tf in counts.items():
+            postings = dictionary.get(term)
+            if postings is None:
+                postings = dictionary[term] = (array("i"), array("i"))
+                used += BYTES_PER_TERM + len(term)
+            postings[0].append(doc_id)
+            postings[1].append(tf)
+        used += BYTES_PER_POSTING * len(counts)
+
+        if used >= memory_budget:
+            runs.append(spill_run(dictionary, run_dir, len(runs)))
+            print(f"   💾 Spilled run {len(runs)} after {doc_id + 1} documents")
+            dictionary, used = {}, 0
+
+    if dictionary:
+        runs.append(spill_run(dictionary, run_dir, len(runs)))
+
+    return runs, np.array(row_index, dtype=np.int64)
+
+
+# ----------------------------------------------------
+# 2. MERGE: k-way merge of the sorted runs
+# ----------------------------------------------------
+def merge_buffer_size(memory_budget, fan_in=MERGE_FANIN):
+    """Read/write buffer per open file: the budget shared by fan_in runs + output."""
+    return int(np.clip(memory_budget // (fan_in + 1), MIN_READ_BUFFER, MAX_READ_BUFFER))
+
+
+def merge_runs(run_paths, out_path, buffer_size=MAX_READ_BUFFER):
+    """
+    Streams the given runs into one term-sorted postings file. Runs hold
+    increasing doc ids, and heapq.merge is stable, so every merged
+    postings list stays sorted by doc id.
+    Returns (terms, df, total tf) for the lexicon.
+    """
+    terms, df, cf = [], [], []
+    merged = heapq.merge(*(read_postings(p, buffer_size) for p in run_paths),
+                         key=lambda rec: rec[0])
+
+    with open(out_path, "wb", buffering=buffer_size) as f:
+        def flush(term, docs, tfs):
+            docs, tfs = np.concatenate(docs), np.concatenate(tfs)
+            write_postings(f, term, docs, tfs)
+            terms.append(term)
+            df.append(len(docs))
+            cf.append(int(tfs.sum()))
+
+        current, docs, tfs = None, [], []
+        for term, d, t in merged:
+            if term != current and current is not None:
+                flush(current, docs, tfs)
+                docs, tfs = [], []
+            current = term
+            docs.append(d)
+            tfs.append(t)
+        if current is not None:
+            flush(current, docs, tfs)
+
+    return np.array(terms, dtype=object), np.array(df, dtype=np.int64), np.array(cf, dtype=np.int64)
+
+
+def merge_all_runs(run_paths, out_path, memory_budget, fan_in=MERGE_FANIN):
+    """
+    Multi-pass merge: while there are more than fan_in runs, consecutive
+    groups of fan_in runs are merged into bigger runs (consecutive groups
+    keep doc ids increasing). The last pass writes out_path.
+    Input runs are deleted as soon as they are merged.
+    """
+    if fan_in < 2:
+        raise ValueError("fan_in must be at least 2")
+    buffer_size = merge_buffer_size(memory_budget, fan_in)
+    runs = [Path(p) for p in run_paths]
+
+    merge_pass = 0
+    while len(runs) > fan_in:
+        merge_pass += 1
+        merged = []
+        for i in range(0, len(runs), fan_in):
+            group = runs[i:i + fan_in]
+            path = group[0].with_name(f"merge_{merge_pass:02d}_{len(merged):05d}.bin")
+            merge_runs(group, path, buffer_size)
+            for run in group:
+                os.remove(run)
+            merged.append(path)
+        print(f"   • merge pass {merge_pass}: {len(runs)} runs -> {len(merged)}")
+        runs = merged
+
+    lexicon = merge_runs(runs, out_path, buffer_size)
+    for run in runs:
+        os.remove(run)
+    return lexicon
+
+
+# ----------------------------------------------------
+# 3-5. LIMIT, NORMS, WEIGHTS
+# ----------------------------------------------------
+def iter_kept_postings(postings_path, mask):
+    """Yields (column, docs, tfs) for the terms kept by the feature mask."""
+    column = 0
+    for i, (_, docs, tfs) in enumerate(read_postings(postings_path)):
+        if mask[i]:
+            yield column, docs, tfs
+            column += 1
+
+
+def write_bm25_postings(postings_path, mask, idf, n_docs, out_dir,
+                        k1=1.5, b=0.75, dtype=np.float32):
+    """
+    Two sequential passes over the merged postings:
+    per-document TF-IDF norms/lengths, then BM25 weights into memmapped CSC arrays.
+    """
+    # Pass A: l2 norm and row sum of the TF-IDF row of every document
+    sq_sum = np.zeros(n_docs, dtype=np.float64)
+    raw_sum = np.zeros(n_docs, dtype=np.float64)
+    nnz = 0
+    for col, docs, tfs in iter_kept_postings(postings_path, mask):
+        w = tfs * idf[col]
+        sq_sum[docs] += w * w  # doc ids are unique inside one postings list
+        raw_sum[docs] += w
+        nnz += len(docs)
+
+    norms = np.sqrt(sq_sum)
+    norms[norms == 0] = 1.0
+    doc_lengths = raw_sum / norms
+    avg_doc_length = doc_lengths.mean()
+
+    # Pass B: BM25 weights, term by term (CSC layout)
+    from numpy.lib.format import open_memmap
+
+    out_dir = Path(out_dir)
+    data = open_memmap(out_dir / "spimi_data.npy", mode="w+", dtype=dtype, shape=(nnz,))
+    indices = open_memmap(out_dir / "spimi_indices.npy", mode="w+", dtype=np.int32, shape=(nnz,))
+    indptr = np.zeros(int(mask.sum()) + 1, dtype=np.int64)
+
+    pos = 0
+    for col, docs, tfs in iter_kept_postings(postings_path, mask):
+        tfidf = tfs * idf[col] / norms[docs]
+        length_norm = 1 - b + b * (doc_lengths[docs] / avg_doc_length)
+        weights = tfidf * (k1 + 1) / (tfidf + k1 * length_norm) * idf[col]
+
+        data[pos:pos + len(docs)] = weights
+        indices[pos:pos + len(docs)] = docs
+        pos += len(docs)
+        indptr[col + 1] = pos
+
+    data.flush()
+    indices.flush()
+    np.save(out_dir / "spimi_indptr.npy", indptr)
+    return doc_lengths, nnz
+
+
+# ----------------------------------------------------
+# Driver
+# ----------------------------------------------------
+def build_spimi_index(documents, stopwords_set, out_dir, memory_mb=256,
+                      min_df=5, max_df=0.95, max_features=20000, tmp_dir=None,
+                      merge_fanin=MERGE_FANIN):
+    """
+    Builds the BM25 index with bounded memory. Returns the stats dict.
+    Output (out_dir): spimi_data/indices/indptr.npy (CSC, docs x terms),
+    spimi_shape.npy, spimi_rows.npy, bm25_feature_names.txt,
+    bm25_idf.npy, bm25_doc_lengths.npy.
+    """
+    from bm25_storage import save_bm25_stats
+    from sharded_build import limit_features
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    run_dir = Path(tempfile.mkdtemp(prefix="spimi_runs_", dir=tmp_dir))
+
+    try:
+        print(f"\n🔨 SPIMI build, memory budget {memory_mb} MB")
+        memory_budget = memory_mb * 1024 * 1024
+        runs, row_index = invert_documents(documents, stopwords_set, run_dir, memory_budget)
+        n_docs = len(row_index)
+        print(f"   • {n_docs} documents inverted into {len(runs)} runs")
+
+        postings_path = run_dir / "postings.bin"
+        terms, df, cf = merge_all_runs(runs, postings_path, memory_budget, merge_fanin)
+        print(f"   • {len(terms)} merged terms")
+
+        mask = limit_features(df, cf, n_docs, min_df, max_df, max_features)
+        idf = np.log((1 + n_docs) / (1 + df[mask])) + 1
+        print(f"   • {int(mask.sum())} terms kept after min_df / max_df / max_features")
+
+        doc_lengths, nnz = write_bm25_postings(postings_path, mask, idf, n_docs, out_dir)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    np.save(out_dir / "spimi_shape.npy", np.array([n_docs, int(mask.sum())], dtype=np.int64))
+    np.save(out_dir / "spimi_rows.npy", row_index)
+    save_bm25_stats(out_dir, doc_lengths, idf)
+    with open(out_dir / "bm25_feature_names.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(terms[mask]))
+
+    stats = {
+        "matrix_name": "BM25-UK-US-SPIMI",
+        "num_documents": n_docs,
+        "num_features": int(mask.sum()),
+        "sparsity": (1 - nnz / max(n_docs * int(mask.sum()), 1)) * 100,
+        "non_zero_elements": nnz,
+        "num_runs": len(runs),
+        "memory_mb": memory_mb,
+    }
+    print(f"✅ SPIMI index ready: {n_docs} docs x {stats['num_features']} terms, nnz={nnz}")
+    return stats
+
+
+def load_spimi_index(out_dir, mmap=True):
+    """
+    Returns the BM25 matrix as a CSC matrix (docs x terms). With mmap=True
+    the data / indices arrays stay memory-mapped on disk.
+    """
+    from scipy.sparse import csc_matrix
+
+    out_dir = Path(out_dir)
+    mode = "r" if mmap else None
+    data = np.load(out_dir / "spimi_data.npy", mmap_mode=mode)
+    indices = np.load(out_dir / "spimi_indices.npy", mmap_mode=mode)
+    indptr = np.load(out_dir / "spimi_indptr.npy")
+    shape = tuple(np.load(out_dir / "spimi_shape.npy"))
+    return csc_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+def main():
+    from sharded_build import df_limit
+
+    parser = argparse.ArgumentParser(description="External-memory (SPIMI) BM25 build")
+    parser.add_argument("--manifest", default="corpus_manifest.csv")
+    parser.add_argument("--output", default="uk_us_outputs/spimi")
+    parser.add_argument("--memory-mb", type=int, default=256)
+    parser.add_argument("--tmp-dir", default=None, help="where run files are spilled")
+    parser.add_argument("--merge-fanin", type=int, default=MERGE_FANIN,
+                        help="max runs merged (open) at once")
+    parser.add_argument("--min-df", type=df_limit, default=5,
+                        help="int = document count, float = fraction")
+    parser.add_argument("--max-df", type=df_limit, default=0.95,
+                        help="int = document count, float = fraction")
+    parser.add_argument("--max-features", type=int, default=20000)
+    parser.add_argument("--export-npz", default=None,
+                        help="also write the standard stage-2 outputs into this folder")
+    args = parser.parse_args()
+
+    from build_bm25 import get_nltk_stopwords
+    stopwords_set = get_nltk_stopwords()
+
+    stats = build_spimi_index(
+        ((row["row_index"], text) for row, text in iter_manifest_documents(args.manifest)),
+        stopwords_set, args.output,
+        memory_mb=args.memory_mb, min_df=args.min_df, max_df=args.max_df,
+        max_features=args.max_features, tmp_dir=args.tmp_dir,
+        merge_fanin=args.merge_fanin,
+    )
+
+    if args.export_npz:
+        # Needs the whole matrix in RAM - only for corpora that fit
+        from bm25_storage import TF_CACHE_FILES, save_bm25_stats
+        from build_bm25 import save_bm25_outputs
+
+        spimi_dir = Path(args.output)
+        X_bm25 = load_spimi_index(spimi_dir, mmap=False).tocsr()
+        with open(spimi_dir / "bm25_feature_names.txt", "r", encoding="utf-8") as f:
+            feature_names = f.read().split("\n")
+        manifest = load_manifest(args.manifest)
+        df = manifest.set_index("row_index").loc[np.load(spimi_dir / "spimi_rows.npy"),
+                                                 ["country", "filename", "date", "source_path"]]
+        df = df.reset_index(drop=True)
+        df["row_index"] = df.index
+        save_bm25_outputs(args.export_npz, X_bm25, feature_names, df, stats)
+        # idf + doc lengths, so the export can classify new documents
+        save_bm25_stats(args.export_npz,
+                        np.load(spimi_dir / TF_CACHE_FILES["doc_lengths"]),
+                        np.load(spimi_dir / TF_CACHE_FILES["idf"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,35 @@
 # stage3_clustering/clustering_algorithms.py
 
 import numpy as np
-from sklearn.cluster import KMeans, DBSCAN
-from sklearn.mixture import GaussianMixture
 
-import hdbscan
+# sklearn / hdbscan are imported inside each run_* function, so only the
+# algorithm that is actually used gets loaded (KMeans does not pull hdbscan).
 
-from .evaluation import evaluate_clustering
+try:
+    from .evaluation import evaluate_clustering
+except ImportError:  # run as a script from stage3_clustering/
+    from evaluation import evaluate_clustering
 
 
-def run_kmeans(X, y):
-    print("\n=== K-MEANS ===")
-    km = KMeans(n_clusters=2, random_state=42)
+def run_kmeans(X, y, n_clusters=2, return_model=False):
+    """
+    return_model=True also returns the fitted KMeans (centroids are reused
+    by selective_search.py). Metrics need 2 clusters and labels y.
+    """
+    from sklearn.cluster import KMeans
+
+    print(f"\n=== K-MEANS (k={n_clusters}) ===")
+    km = KMeans(n_clusters=n_clusters, random_state=42)
     labels = km.fit_predict(X)
-    return labels, evaluate_clustering(y, labels)
+    metrics = evaluate_clustering(y, labels) if y is not None and n_clusters == 2 else None
+    if return_model:
+        return labels, metrics, km
+    return labels, metrics
 
 
 def run_dbscan(X, y, eps=0.7, min_samples=5):
+    from sklearn.cluster import DBSCAN
+
     print("\n=== DBSCAN ===")
     db = DBSCAN(metric="cosine", eps=eps, min_samples=min_samples)
     labels = db.fit_predict(X)
@@ -24,6 +37,8 @@ def run_dbscan(X, y, eps=0.7, min_samples=5):
 
 
 def run_hdbscan(X, y, min_cluster_size=10, min_samples=5):
+    import hdbscan
+
     print("\n=== HDBSCAN ===")
     hdb = hdbscan.HDBSCAN(
         metric="cosine",
@@ -35,6 +50,8 @@ def run_hdbscan(X, y, min_cluster_size=10, min_samples=5):
 
 
 def run_gmm(X, y):
+    from sklearn.mixture import GaussianMixture
+
     print("\n=== GMM ===")
     gmm = GaussianMixture(n_components=2, random_state=42)
     labels = gmm.fit_predict(X.toarray())
@@ -1,11 +1,11 @@
 # stage3_clustering/evaluation.py
 
 import numpy as np
-from sklearn.metrics import precision_score, recall_score, f1_score, accuracy_score
 
 def evaluate_clustering(true_labels, cluster_labels):
     """Evaluate clustering quality vs true labels.
        Handles noise (-1) and flips label mapping automatically."""
+    from sklearn.metrics import precision_score, recall_score, f1_score, accuracy_score
 
     mask = cluster_labels != -1
     tl = np.array(true_labels)[mask]
@@ -1,9 +1,15 @@
 # stage3_clustering/run_stage3.py
 
+import argparse
+import sys
 from pathlib import Path
-from scipy.sparse import load_npz
 import numpy as np
 
+# stage-2 storage helpers (float32 / quantized BM25 matrices)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "stage2_bm25"))
+from bm25_storage import load_bm25_matrix
+from date_partitions import load_date_range, parse_date_range
+
 from clustering_algorithms import (
     run_kmeans, run_dbscan, run_hdbscan, run_gmm
 )
@@ -12,12 +18,33 @@ from visualization import plot_tsne, plot_umap
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Stage 3: clustering")
+    parser.add_argument("--date-from", default=None, help="YYYY-MM-DD (inclusive)")
+    parser.add_argument("--date-to", default=None, help="YYYY-MM-DD (inclusive)")
+    args = parser.parse_args()
+
+    try:
+        args.date_from, args.date_to = parse_date_range(args.date_from, args.date_to)
+    except ValueError as e:
+        parser.error(str(e))
+
     BASE = Path("../uk_us_outputs")
 
-    print("Loading BM25 matrix...")
-    X = load_npz(BASE / "X_bm25_uk_us.npz")
     y = np.load(BASE / "y_labels_num.npy")
 
+    if args.date_from or args.date_to:
+        # Only the date partitions overlapping the range are loaded
+        print(f"Loading BM25 partitions {args.date_from} → {args.date_to}...")
+        try:
+            X, row_index, _ = load_date_range(BASE / "date_partitions",
+                                              args.date_from, args.date_to)
+        except ValueError as e:  # no documents in the range
+            parser.error(str(e))
+        y = y[row_index]
+    else:
+        print("Loading BM25 matrix...")
+        X = load_bm25_matrix(BASE / "X_bm25_uk_us.npz")
+
     print(f"X shape: {X.shape}")
     print(f"y length: {len(y)}")
 
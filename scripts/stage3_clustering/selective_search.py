@@ -0,0 +1,203 @@
+# stage3_clustering/selective_search.py
+"""
+Cluster-routed selective search.
+
+KMeans (k well above 2) groups the BM25 rows into topical clusters. The
+index is rewritten in cluster order, so every cluster is one contiguous
+shard:
+
+    cluster_index/
+        X_cluster_ordered.npz   BM25 rows sorted by cluster
+        cluster_rows.npy        global row_index of every ordered row
+        cluster_offsets.npy     shard c = rows [offsets[c], offsets[c+1])
+        cluster_centroids.npy   KMeans centroids (k x terms)
+        cluster_term_max.npy    max BM25 weight of every term inside each shard
+
+At query time the query terms are scored against the centroids (or the
+per-shard term maxima, routing="max") and only the top n_probe shards are
+searched. The report compares recall@k with exhaustive BM25 and the
+latency saved.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "stage2_bm25"))
+from bm25_storage import save_bm25_matrix, load_bm25_matrix, sample_queries
+from search import top_k
+
+from clustering_algorithms import run_kmeans
+
+
+# ========================
+# Build cluster-ordered shards
+# ========================
+def build_cluster_shards(X, out_dir, n_clusters=32):
+    """
+    Runs KMeans on the l2-normalized rows (spherical k-means gives far more
+    balanced clusters than raw BM25 lengths), keeps the model's centroids
+    and writes the shards.
+    """
+    from sklearn.preprocessing import normalize
+
+    X = csr_matrix(X)
+    labels, _, km = run_kmeans(normalize(X), None, n_clusters=n_clusters, return_model=True)
+
+    order = np.argsort(labels, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_clusters))])
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    save_bm25_matrix(out_dir / "X_cluster_ordered.npz", X[order], precision="float32")
+    np.save(out_dir / "cluster_rows.npy", order.astype(np.int64))
+    np.save(out_dir / "cluster_offsets.npy", offsets.astype(np.int64))
+    np.save(out_dir / "cluster_centroids.npy", km.cluster_centers_.astype(np.float32))
+
+    X_ordered = X[order]
+    term_max = np.vstack([
+        X_ordered[offsets[c]:offsets[c + 1]].max(axis=0).toarray().ravel()
+        for c in range(n_clusters)
+    ])
+    np.save(out_dir / "cluster_term_max.npy", term_max.astype(np.float32))
+
+    sizes = np.diff(offsets)
+    print(f"Saved {n_clusters} cluster shards to {out_dir} "
+          f"(sizes: min={sizes.min()}, median={int(np.median(sizes))}, max={sizes.max()})")
+
+
+def load_cluster_shards(index_dir):
+    """Returns a dict with the per-cluster CSC shards, row ids and centroids."""
+    index_dir = Path(index_dir)
+    X = load_bm25_matrix(index_dir / "X_cluster_ordered.npz")
+    offsets = np.load(index_dir / "cluster_offsets.npy")
+    return {
+        "shards": [X[offsets[c]:offsets[c + 1]].tocsc() for c in range(len(offsets) - 1)],
+        "rows": np.load(index_dir / "cluster_rows.npy"),
+        "offsets": offsets,
+        "centroids": np.load(index_dir / "cluster_centroids.npy"),
+        "term_max": np.load(index_dir / "cluster_term_max.npy"),
+    }
+
+
+# ========================
+# Query time
+# ========================
+def score_csc(X_csc, term_ids):
+    """BM25 scores of all rows, walking only the query terms' postings."""
+    scores = np.zeros(X_csc.shape[0], dtype=np.float32)
+    for t in term_ids:
+        start, end = X_csc.indptr[t], X_csc.indptr[t + 1]
+        scores[X_csc.indices[start:end]] += X_csc.data[start:end]
+    return scores
+
+
+def route_query(index, term_ids, n_probe, routing="centroid"):
+    """
+    Top n_probe clusters for the query terms:
+    routing="centroid" scores the KMeans centroids,
+    routing="max" scores each shard's maximum BM25 weight per term.
+    """
+    table = index["centroids"] if routing == "centroid" else index["term_max"]
+    scores = table[:, term_ids].sum(axis=1)
+    return top_k(scores, n_probe)
+
+
+def selective_search(index, term_ids, k=10, n_probe=2, routing="centroid"):
+    """Searches only the routed shards. Returns (global row ids, scores)."""
+    rows, scores = [], []
+    for c in route_query(index, term_ids, n_probe, routing):
+        shard = index["shards"][c]
+        if shard.shape[0] == 0:
+            continue
+        s = score_csc(shard, term_ids)
+        top = top_k(s, k)
+        top = top[s[top] > 0]  # rows without any query term are not hits
+        rows.append(index["rows"][index["offsets"][c] + top])
+        scores.append(s[top])
+
+    if not rows:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+    rows, scores = np.concatenate(rows), np.concatenate(scores)
+    order = np.lexsort((rows, -scores))[:k]
+    return rows[order], scores[order]
+
+
+def exhaustive_search(X_csc, term_ids, k=10):
+    scores = score_csc(X_csc, term_ids)
+    top = top_k(scores, k)
+    top = top[scores[top] > 0]
+    return top, scores[top]
+
+
+# ========================
+# Report: recall@k and latency vs exhaustive BM25
+# ========================
+def evaluate_selective_search(X, index, n_probes=(1, 2, 4, 8), k=10, n_queries=200,
+                              routings=("centroid", "max")):
+    X_csc = csr_matrix(X).tocsc()
+    queries = sample_queries(csr_matrix(X), n_queries=n_queries)
+    n_docs = X.shape[0]
+
+    t0 = time.perf_counter()
+    exact = [set(exhaustive_search(X_csc, q, k)[0]) for q in queries]
+    exhaustive_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+    rows = [{"routing": "exhaustive", "n_probe": len(index["shards"]),
+             f"recall@{k}": 1.0, "docs_scored": 1.0,
+             "ms_per_query": exhaustive_ms, "speedup": 1.0}]
+
+    sizes = np.diff(index["offsets"])
+    for routing in routings:
+        for n_probe in n_probes:
+            recalls = []
+            t0 = time.perf_counter()
+            for q, ref in zip(queries, exact):
+                got, _ = selective_search(index, q, k, n_probe, routing)
+                if ref:  # recall is undefined when no document matches
+                    recalls.append(len(ref & set(got)) / len(ref))
+            ms = (time.perf_counter() - t0) * 1000 / len(queries)
+            scored = [sizes[route_query(index, q, n_probe, routing)].sum() / n_docs
+                      for q in queries]
+
+            rows.append({"routing": routing, "n_probe": n_probe,
+                         f"recall@{k}": float(np.mean(recalls)) if recalls else np.nan,
+                         "docs_scored": float(np.mean(scored)),
+                         "ms_per_query": ms, "speedup": exhaustive_ms / ms})
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster-routed selective search")
+    parser.add_argument("--clusters", type=int, default=32)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    BASE = Path("../uk_us_outputs")
+    INDEX_DIR = BASE / "cluster_index"
+
+    print("Loading BM25 matrix...")
+    X = load_bm25_matrix(BASE / "X_bm25_uk_us.npz")
+
+    centroids_file = INDEX_DIR / "cluster_centroids.npy"
+    if args.rebuild or not centroids_file.exists() \
+            or len(np.load(centroids_file)) != args.clusters:
+        build_cluster_shards(X, INDEX_DIR, n_clusters=args.clusters)
+
+    index = load_cluster_shards(INDEX_DIR)
+    report = evaluate_selective_search(X, index, n_probes=args.n_probe, k=args.k)
+    report.to_csv(INDEX_DIR / "selective_search_report.csv", index=False)
+
+    print("\n=== SELECTIVE SEARCH vs EXHAUSTIVE ===")
+    print(report.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,15 @@
 # stage3_clustering/visualization.py
 
-import matplotlib.pyplot as plt
-from sklearn.manifold import TSNE
 import numpy as np
 
-try:
-    import umap
-    has_umap = True
-except:
-    has_umap = False
+# matplotlib / TSNE / umap are imported on first use (they are slow to import
+# and not needed when no plot is drawn).
 
 
 def plot_tsne(X, labels, title="t-SNE Clustering"):
+    import matplotlib.pyplot as plt
+    from sklearn.manifold import TSNE
+
     emb = TSNE(n_components=2, random_state=42, perplexity=30)\
             .fit_transform(X.toarray())
 
@@ -22,9 +20,12 @@ def plot_tsne(X, labels, title="t-SNE Clustering"):
 
 
 def plot_umap(X, labels, title="UMAP Clustering"):
-    if not has_umap:
+    try:
+        import umap
+    except ImportError:
         print("UMAP not installed. Skipping.")
         return
+    import matplotlib.pyplot as plt
 
     reducer = umap.UMAP(n_components=2, metric="cosine", random_state=42)
     emb = reducer.fit_transform(X)
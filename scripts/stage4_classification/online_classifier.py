@@ -0,0 +1,353 @@
+"""
+Stage 4: Streaming UK/US Classifier
+===================================
+
+Supervised counterpart of stage 3: a linear UK-vs-US model (SGD with
+logistic or hinge loss) trained with partial_fit over row blocks of the
+stage-2 BM25 matrix.
+
+- Training streams fixed-size row blocks from the memory-mapped row store
+  of X_bm25_uk_us.npz (or one date partition at a time with --partitions),
+  so memory holds a few blocks, not the corpus; the model itself is one
+  weight per vocabulary term.
+- The index is sorted by country (all UK_ rows, then US_), so every epoch
+  shuffles the block order and mixes --mix-blocks random blocks into each
+  partial_fit batch (rows shuffled inside it).
+- A fixed, seeded held-out split is scored with precision / recall / f1 /
+  accuracy (same tuple as stage-3 evaluate_clustering, without the
+  label flip: a classifier has to get the direction right).
+- New documents are classified in batches WITHOUT rebuilding the index:
+  they are vectorized with the saved vocabulary, idf and average document
+  length (bm25_feature_names.txt, bm25_idf.npy, bm25_doc_lengths.npy),
+  giving exactly the weights the index would have assigned them.
+
+Labels follow y_labels_num.npy: 0 = UK, 1 = US.
+
+Usage:
+    python online_classifier.py train --index ../uk_us_outputs --loss log_loss --epochs 5
+    python online_classifier.py classify new_docs/*.txt
+    python online_classifier.py classify --manifest ../new_manifest.csv --output predictions.csv
+"""
+
+import argparse
+import csv
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "stage1_prepering_data"))
+sys.path.append(str(Path(__file__).resolve().parent.parent / "stage2_bm25"))
+from corpus_manifest import iter_manifest_documents
+from build_bm25 import BM25Transformer, TOKEN_PATTERN
+from bm25_storage import TF_CACHE_FILES, open_row_store, read_row_block, save_row_store
+
+
+CLASSES = np.array([0, 1])
+CLASS_NAMES = {0: "UK", 1: "US"}
+MODEL_FILE = "sgd_uk_us.joblib"
+
+
+# ----------------------------------------------------
+# Streaming over the index
+# ----------------------------------------------------
+def heldout_mask(n_rows, test_size=0.2, seed=42):
+    """Fixed held-out split over global row_index (same rows in every run)."""
+    return np.random.default_rng(seed).random(n_rows) < test_size
+
+
+def open_index_row_store(index_dir):
+    """Row store of the index matrix; written once from the .npz if missing."""
+    from scipy.sparse import load_npz
+
+    matrix_path = Path(index_dir) / "X_bm25_uk_us.npz"
+    try:
+        return open_row_store(matrix_path)
+    except FileNotFoundError:
+        print(f"📦 No row store next to {matrix_path.name}, writing it once...")
+        save_row_store(matrix_path, load_npz(matrix_path))
+        return open_row_store(matrix_path)
+
+
+def _shuffled(X, rows, rng):
+    if rng is None:
+        return X, rows
+    perm = rng.permutation(len(rows))
+    return X[perm], rows[perm]
+
+
+def iter_row_store_batches(store, block_size=256, rng=None, mix_blocks=4):
+    """
+    Batches of memory-mapped row blocks. With rng (training) the block
+    order is shuffled and mix_blocks random blocks form one batch; without
+    rng (evaluation) blocks come one at a time in index order.
+    """
+    from scipy.sparse import vstack
+
+    n_rows = store["shape"][0]
+    starts = np.arange(0, n_rows, block_size)
+    if rng is None:
+        mix_blocks = 1
+    else:
+        starts = rng.permutation(starts)
+
+    for i in range(0, len(starts), mix_blocks):
+        group = starts[i:i + mix_blocks].tolist()
+        stops = [min(start + block_size, n_rows) for start in group]
+        X = vstack([read_row_block(store, a, b) for a, b in zip(group, stops)]).tocsr()
+        rows = np.concatenate([np.arange(a, b) for a, b in zip(group, stops)])
+        yield _shuffled(X, rows, rng)
+
+
+def iter_partition_batches(partition_dir, block_size=256, rng=None):
+    """
+    One date partition in memory at a time (partition order shuffled with
+    rng). Months hold both countries, so rows are shuffled per partition.
+    """
+    from date_partitions import load_partitions_table, load_partition
+
+    matrix_files = load_partitions_table(partition_dir)["matrix_file"].tolist()
+    if rng is not None:
+        matrix_files = [matrix_files[i] for i in rng.permutation(len(matrix_files))]
+
+    for matrix_file in matrix_files:
+        X, rows, _ = load_partition(partition_dir, matrix_file)
+        X, rows = _shuffled(X, rows, rng)
+        for start in range(0, X.shape[0], block_size):
+            yield X[start:start + block_size], rows[start:start + block_size]
+
+
+def iter_index_blocks(index_dir, block_size=256, use_partitions=False, rng=None,
+                      mix_blocks=4):
+    """Training / evaluation batches of the whole index: (X_batch, row_index)."""
+    index_dir = Path(index_dir)
+    if use_partitions:
+        return iter_partition_batches(index_dir / "date_partitions", block_size, rng)
+    return iter_row_store_batches(open_index_row_store(index_dir), block_size, rng, mix_blocks)
+
+
+# ----------------------------------------------------
+# Train / evaluate
+# ----------------------------------------------------
+def evaluate_classifier(true_labels, pred_labels):
+    """(precision, recall, f1, accuracy) with US = positive class."""
+    from sklearn.metrics import precision_score, recall_score, f1_score, accuracy_score
+
+    return (
+        precision_score(true_labels, pred_labels, zero_division=0),
+        recall_score(true_labels, pred_labels, zero_division=0),
+        f1_score(true_labels, pred_labels, zero_division=0),
+        accuracy_score(true_labels, pred_labels),
+    )
+
+
+def train_streaming(blocks_fn, y, heldout, loss="log_loss", alpha=1e-4,
+                    epochs=5, seed=42):
+    """
+    blocks_fn(rng) -> iterable of (X_batch, row_index_batch); called once
+    per epoch with a fresh shuffle, and with rng=None for the held-out
+    scoring, so the data is streamed again instead of kept in memory.
+    Held-out rows are skipped during training and scored at the end.
+    Returns (model, metrics).
+    """
+    from sklearn.linear_model import SGDClassifier
+
+    model = SGDClassifier(loss=loss, alpha=alpha, random_state=seed)
+    rng = np.random.default_rng(seed)
+
+    for epoch in range(1, epochs + 1):
+        n_seen = 0
+        for X_block, rows in blocks_fn(rng):
+            train = np.flatnonzero(~heldout[rows])
+            if len(train) == 0:
+                continue
+            model.partial_fit(X_block[train], y[rows[train]], classes=CLASSES)
+            n_seen += len(train)
+        print(f"   epoch {epoch}/{epochs}: {n_seen} training rows")
+
+    true, pred = [], []
+    for X_block, rows in blocks_fn(None):
+        test = np.flatnonzero(heldout[rows])
+        if len(test):
+            true.append(y[rows[test]])
+            pred.append(model.predict(X_block[test]))
+
+    metrics = None
+    if true:
+        metrics = evaluate_classifier(np.concatenate(true), np.concatenate(pred))
+    return model, metrics
+
+
+def save_model(path, model, index_dir, metrics=None):
+    import joblib
+
+    joblib.dump({"model": model, "index_dir": str(index_dir), "metrics": metrics}, path)
+    print(f"💾 Model saved to: {path}")
+
+
+def load_model(path):
+    import joblib
+
+    return joblib.load(path)
+
+
+# ----------------------------------------------------
+# New documents -> BM25 rows (no index rebuild)
+# ----------------------------------------------------
+class DocumentVectorizer:
+    """
+    Re-applies the stage-2 pipeline with the frozen vocabulary:
+    term counts x idf -> l2 normalize -> BM25 (doc length = row sum,
+    average length of the indexed corpus).
+    """
+
+    def __init__(self, index_dir, k1=1.5, b=0.75):
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        index_dir = Path(index_dir)
+        with open(index_dir / "bm25_feature_names.txt", "r", encoding="utf-8") as f:
+            vocabulary = [line.rstrip("\n") for line in f]
+
+        self.counter = CountVectorizer(vocabulary=vocabulary, lowercase=True,
+                                       token_pattern=TOKEN_PATTERN)
+        self.idf = np.load(index_dir / TF_CACHE_FILES["idf"])
+        self.avg_doc_length = np.load(index_dir / TF_CACHE_FILES["doc_lengths"]).mean()
+        self.bm25 = BM25Transformer(k1=k1, b=b)
+
+    def transform(self, texts):
+        from sklearn.preprocessing import normalize
+
+        tf = self.counter.transform(texts).astype(np.float64)
+        tf.data *= self.idf[tf.indices]
+        tfidf = normalize(tf, norm="l2", copy=False)
+        doc_lengths = np.asarray(tfidf.sum(axis=1)).ravel()
+        X = self.bm25.fit_transform(tfidf, doc_lengths, self.avg_doc_length, self.idf)
+        return X.astype(np.float32)
+
+
+def iter_input_documents(files=(), manifest_path=None):
+    """
+    Yields (filename, text) of the documents to classify: the rows of a
+    manifest, or loose text files (read through the same manifest reader).
+    """
+    rows = None
+    if manifest_path is None:
+        rows = [{"filename": Path(p).name, "source_path": str(Path(p).resolve())}
+                for p in files]
+    for row, text in iter_manifest_documents(manifest_path, rows):
+        yield row["filename"], text
+
+
+def iter_batches(documents, batch_size=512):
+    """Groups (filename, text) pairs into (names, texts) batches."""
+    names, texts = [], []
+    for name, text in documents:
+        names.append(name)
+        texts.append(text)
+        if len(texts) == batch_size:
+            yield names, texts
+            names, texts = [], []
+    if texts:
+        yield names, texts
+
+
+def classify_documents(model, vectorizer, documents, batch_size=512):
+    """
+    documents: iterable of (filename, text), see iter_input_documents.
+    Returns a list of (filename, label, score) and timing
+    (vectorize seconds, predict seconds).
+    score = P(US) for log_loss, the signed margin for hinge.
+    """
+    results = []
+    t_vec = t_pred = 0.0
+    for names, texts in iter_batches(documents, batch_size):
+        t0 = time.perf_counter()
+        X = vectorizer.transform(texts)
+        t1 = time.perf_counter()
+        if model.loss == "log_loss":
+            scores = model.predict_proba(X)[:, 1]
+            labels = (scores >= 0.5).astype(int)
+        else:
+            scores = model.decision_function(X)
+            labels = (scores > 0).astype(int)
+        t2 = time.perf_counter()
+
+        t_vec += t1 - t0
+        t_pred += t2 - t1
+        results.extend(zip(names, labels.tolist(), scores.tolist()))
+    return results, (t_vec, t_pred)
+
+
+# ----------------------------------------------------
+# CLI
+# ----------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Stage 4: streaming UK/US classifier")
+    parser.add_argument("step", choices=["train", "classify"])
+    parser.add_argument("files", nargs="*", help="text files to classify")
+    parser.add_argument("--index", default="../uk_us_outputs")
+    parser.add_argument("--model", default=None, help=f"default: <index>/{MODEL_FILE}")
+    parser.add_argument("--loss", default="log_loss", choices=["log_loss", "hinge"])
+    parser.add_argument("--alpha", type=float, default=1e-4)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--block-size", type=int, default=256)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--mix-blocks", type=int, default=4,
+                        help="random row blocks mixed into one training batch")
+    parser.add_argument("--partitions", action="store_true",
+                        help="stream one date partition at a time")
+    parser.add_argument("--manifest", default=None, help="classify the documents of a manifest")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--output", default=None, help="predictions CSV")
+    args = parser.parse_intermixed_args()
+
+    index_dir = Path(args.index)
+    model_path = Path(args.model) if args.model else index_dir / MODEL_FILE
+
+    if args.step == "train":
+        y = np.load(index_dir / "y_labels_num.npy")
+        heldout = heldout_mask(len(y), args.test_size)
+        print(f"\n🧠 Training SGD ({args.loss}) on {int((~heldout).sum())} rows, "
+              f"{int(heldout.sum())} held out")
+
+        model, metrics = train_streaming(
+            lambda rng: iter_index_blocks(index_dir, args.block_size, args.partitions,
+                                          rng, args.mix_blocks),
+            y, heldout, loss=args.loss, alpha=args.alpha, epochs=args.epochs,
+        )
+        if metrics is not None:
+            p, r, f, a = metrics
+            print(f"\n=== HELD-OUT ===\nprecision={p:.4f} recall={r:.4f} f1={f:.4f} accuracy={a:.4f}")
+        save_model(model_path, model, index_dir, metrics)
+        return
+
+    if not args.manifest and not args.files:
+        parser.error("classify needs text files or --manifest")
+
+    model = load_model(model_path)["model"]
+    vectorizer = DocumentVectorizer(index_dir)
+    documents = iter_input_documents(args.files, args.manifest)
+    results, (t_vec, t_pred) = classify_documents(model, vectorizer, documents, args.batch_size)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["filename", "label", "country", "score"])
+            for name, label, score in results:
+                writer.writerow([name, label, CLASS_NAMES[label], f"{score:.6f}"])
+        print(f"💾 Predictions saved to: {args.output}")
+    else:
+        for name, label, score in results:
+            print(f"{CLASS_NAMES[label]}  {score:8.4f}  {name}")
+
+    n = len(results)
+    if n == 0:
+        print("No readable, non-empty documents to classify.")
+        return
+    print(f"\n⏱️  {n} documents: vectorize {t_vec / n * 1e6:.1f} µs/doc, "
+          f"predict {t_pred / n * 1e6:.2f} µs/doc")
+
+
+if __name__ == "__main__":
+    main()